@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+仮名化用のエンティティ対応表
+
+個人名・会社名ごとに一意な番号を割り当て、複数ファイル・複数回の実行で同じ名前が同じ仮名になるようにする。
+対応表はキーのハッシュで分割した複数のSQLiteファイル（シャード）に追記のみで保存するため、
+複数のワーカープロセスが同時に書き込んでも別シャードへの書き込みは互いに待たない。
+1ファイル分のエンティティはシャードごとに1回の問い合わせ・1回のトランザクションでまとめて処理する。
+
+保存形式（<対応表フォルダ>/）:
+  meta.json           シャード数（番号の計算に使うため、作成後は変更しない）
+  shard_XX.sqlite3    entities テーブル（追記のみ）と tokens ビュー（仮名を含む）
+
+番号は (シャード内のid - 1) * シャード数 + シャード番号 + 1 で、全シャードで重複しない。
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_SHARDS = 8
+
+# エンティティタイプ → 仮名のラベル
+LABELS = {
+    "PERSON": "個人名",
+    "ORGANIZATION": "会社名",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    UNIQUE (entity_type, value)
+);
+CREATE TRIGGER IF NOT EXISTS entities_no_update BEFORE UPDATE ON entities
+BEGIN
+    SELECT RAISE(ABORT, 'entities is append-only');
+END;
+CREATE TRIGGER IF NOT EXISTS entities_no_delete BEFORE DELETE ON entities
+BEGIN
+    SELECT RAISE(ABORT, 'entities is append-only');
+END;
+"""
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_value(value: str) -> str:
+    """表記ゆれ（全角・半角、空白）を揃えて対応表のキーにする"""
+    return _WHITESPACE_RE.sub('', unicodedata.normalize('NFKC', value))
+
+
+def format_token(entity_type: str, number: int) -> str:
+    """仮名の文字列（例: [個人名_0042]）"""
+    return f"[{LABELS[entity_type]}_{number:04d}]"
+
+
+class EntityMap:
+    """シャード分割した追記専用のエンティティ対応表"""
+
+    def __init__(self, path: str, shards: int = DEFAULT_SHARDS):
+        """
+        Args:
+            path: 対応表フォルダ
+            shards: 新規作成時のシャード数（既存の対応表では保存済みの値を使う）
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.shards = self._load_shards(shards)
+        self.connections: Dict[int, sqlite3.Connection] = {}
+        # 割り当て済みの番号は変わらないため、プロセス内でキャッシュする
+        self.cache: Dict[Tuple[str, str], int] = {}
+        self.pid = os.getpid()
+        for shard in range(self.shards):
+            self._connect(shard)
+
+    def _load_shards(self, shards: int) -> int:
+        meta_path = os.path.join(self.path, 'meta.json')
+        try:
+            # 複数プロセスが同時に作成しても1つだけが書き込むよう O_EXCL で作成する
+            fd = os.open(meta_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)['shards']
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'shards': shards, 'created_at': datetime.now().isoformat()}, f)
+        return shards
+
+    def _connect(self, shard: int) -> sqlite3.Connection:
+        if self.pid != os.getpid():
+            # fork後は親プロセスの接続を使わない
+            self.connections = {}
+            self.pid = os.getpid()
+        conn = self.connections.get(shard)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, f'shard_{shard:02d}.sqlite3'),
+                                   timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            cases = ' '.join(f"WHEN '{entity_type}' THEN '{label}'" for entity_type, label in LABELS.items())
+            conn.execute(f"""
+                CREATE VIEW IF NOT EXISTS tokens AS
+                SELECT '[' || CASE entity_type {cases} END || '_'
+                       || printf('%04d', (id - 1) * {self.shards} + {shard + 1}) || ']' AS token,
+                       entity_type, value, created_at
+                FROM entities
+            """)
+            self.connections[shard] = conn
+        return conn
+
+    def shard_of(self, key: Tuple[str, str]) -> int:
+        # Pythonのhash()はプロセスごとに変わるため、固定のハッシュ関数を使う
+        digest = hashlib.blake2b(f'{key[0]}\x00{key[1]}'.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.shards
+
+    def _number(self, shard: int, row_id: int) -> int:
+        return (row_id - 1) * self.shards + shard + 1
+
+    def lookup(self, entities: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """
+        (エンティティタイプ, 値) の組ごとに仮名を返す（未登録のものは登録する）
+
+        Returns:
+            (エンティティタイプ, 元の値) → 仮名 の辞書
+        """
+        keys = {}
+        for entity_type, value in entities:
+            keys[(entity_type, value)] = (entity_type, normalize_value(value))
+
+        by_shard: Dict[int, List[Tuple[str, str]]] = {}
+        for key in set(keys.values()):
+            if key not in self.cache:
+                by_shard.setdefault(self.shard_of(key), []).append(key)
+        for shard, missing in by_shard.items():
+            self._resolve(shard, missing)
+
+        return {original: format_token(key[0], self.cache[key]) for original, key in keys.items()}
+
+    def _select(self, conn: sqlite3.Connection, shard: int, keys: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """登録済みのものをキャッシュに入れ、未登録のキーを返す"""
+        remaining = set(keys)
+        for entity_type in {key[0] for key in keys}:
+            values = [key[1] for key in keys if key[0] == entity_type]
+            for start in range(0, len(values), 500):
+                batch = values[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(
+                    f'SELECT id, value FROM entities WHERE entity_type = ? AND value IN ({placeholders})',
+                    [entity_type] + batch)
+                for row_id, value in rows:
+                    self.cache[(entity_type, value)] = self._number(shard, row_id)
+                    remaining.discard((entity_type, value))
+        return sorted(remaining)
+
+    def _resolve(self, shard: int, keys: List[Tuple[str, str]]) -> None:
+        conn = self._connect(shard)
+        # 登録済みなら書き込みロックを取らずに済む
+        missing = self._select(conn, shard, keys)
+        if not missing:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = datetime.now().isoformat()
+            conn.executemany('INSERT OR IGNORE INTO entities (entity_type, value, created_at) VALUES (?, ?, ?)',
+                             [(entity_type, value, now) for entity_type, value in missing])
+            self._select(conn, shard, missing)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def entries(self, entity_type: Optional[str] = None) -> Iterator[Tuple[str, str, str, str]]:
+        """登録済みの (仮名, エンティティタイプ, 値, 登録日時) を番号順に返す"""
+        rows = []
+        for shard in range(self.shards):
+            query = 'SELECT id, entity_type, value, created_at FROM entities'
+            params: List[str] = []
+            if entity_type:
+                query += ' WHERE entity_type = ?'
+                params.append(entity_type)
+            for row_id, row_type, value, created_at in self._connect(shard).execute(query, params):
+                rows.append((self._number(shard, row_id), row_type, value, created_at))
+        for number, row_type, value, created_at in sorted(rows):
+            yield format_token(row_type, number), row_type, value, created_at
+
+    def close(self) -> None:
+        for conn in self.connections.values():
+            conn.close()
+        self.connections = {}
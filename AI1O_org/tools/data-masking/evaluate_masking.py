@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+マスキング設定の精度と速度を比較する評価スクリプト
+
+正解ラベル付きコーパスを各設定（モデル × チャンクサイズ × 除外コンポーネント）で解析し、
+エンティティ種別ごとの適合率・再現率と、処理速度（文字/秒）・メモリ使用量を測定する。
+再現率の下限（--recall-floor）を満たす設定のうち最も速いものを推奨として表示する。
+
+コーパスはJSONL形式で、1行に1文書:
+  {"text": "<PERSON>山田太郎</PERSON>さんは<ORG>株式会社サイバーエージェント</ORG>で働いています。"}
+または文字オフセットで正解を指定:
+  {"text": "...", "entities": [{"start": 0, "end": 4, "type": "PERSON"}]}
+"""
+import json
+import multiprocessing as mp
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+DEFAULT_CORPUS = Path(__file__).parent / 'eval' / 'sample_corpus.jsonl'
+DEFAULT_MODELS = ('ja_ginza', 'ja_ginza_electra', 'ja_core_news_sm')
+# 同梱コーパス（数KB）より小さいサイズも含め、チャンク分割の影響を比較できるようにする
+DEFAULT_CHUNK_SIZES = (1000, 10000, 40000)
+ENTITY_TYPES = ('PERSON', 'ORGANIZATION')
+
+# コーパスのタグ名 → TextMaskerのエンティティタイプ
+TAG_TYPES = {
+    'PERSON': 'PERSON',
+    'ORG': 'ORGANIZATION',
+    'ORGANIZATION': 'ORGANIZATION',
+}
+_TAG_RE = re.compile(r'<(PERSON|ORG|ORGANIZATION)>(.*?)</\1>', re.DOTALL)
+
+
+def parse_tagged(text: str) -> Tuple[str, List[dict]]:
+    """タグ付きテキストからタグを除いた本文と正解エンティティを取り出す"""
+    plain = []
+    entities = []
+    position = 0
+    length = 0
+    for match in _TAG_RE.finditer(text):
+        before = text[position:match.start()]
+        plain.append(before)
+        length += len(before)
+        value = match.group(2)
+        entities.append({'start': length, 'end': length + len(value), 'type': TAG_TYPES[match.group(1)]})
+        plain.append(value)
+        length += len(value)
+        position = match.end()
+    plain.append(text[position:])
+    return ''.join(plain), entities
+
+
+def load_corpus(path: Path) -> Tuple[str, List[dict]]:
+    """
+    コーパスを読み込み、全文書を改行で連結した1つのテキストにする
+
+    1ファイルを処理する場合と同様にチャンク分割の影響も測定できるよう、連結したテキストで評価する。
+
+    Returns:
+        (連結したテキスト, 連結後のオフセットでの正解エンティティ) のタプル
+    """
+    texts = []
+    gold = []
+    offset = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'entities' in record:
+                text = record['text']
+                entities = [{'start': e['start'], 'end': e['end'],
+                             'type': TAG_TYPES.get(e['type'], e['type'])} for e in record['entities']]
+            else:
+                text, entities = parse_tagged(record['text'])
+            for entity in entities:
+                gold.append({
+                    'start': entity['start'] + offset,
+                    'end': entity['end'] + offset,
+                    'type': entity['type'],
+                    'text': text[entity['start']:entity['end']],
+                    'line': line_number,
+                })
+            texts.append(text)
+            offset += len(text) + 1
+    return '\n'.join(texts), gold
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_config(model: str, chunk_size: int, exclude: Tuple[str, ...], text: str, repeat: int) -> Dict[str, Any]:
+    """
+    1つの設定でコーパスを解析する（設定ごとに別プロセスで実行し、メモリを独立に測る）
+
+    Returns:
+        処理時間・メモリと抽出したエンティティを含む辞書
+    """
+    from mask_text import TextMasker
+
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    masker = TextMasker(model=model, max_chunk_size=chunk_size, exclude=exclude)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = _peak_rss_mb()
+
+    # 初回呼び出しのオーバーヘッドを除くため、短いテキストで1回解析しておく
+    masker.find_entities(text[:200])
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        predicted = masker.find_entities(text)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'load_seconds': round(load_seconds, 3),
+        'seconds': round(elapsed, 3),
+        'chars_per_second': round(len(text) * repeat / elapsed) if elapsed else None,
+        'model_mb': round(rss_loaded - rss_before, 1) if rss_before is not None else None,
+        'peak_mb': round(_peak_rss_mb(), 1) if rss_before is not None else None,
+        'predicted': [{'start': r['start'], 'end': r['end'], 'type': r['entity_type']} for r in predicted],
+    }
+
+
+def _overlaps(a: dict, b: dict) -> bool:
+    return a['start'] < b['end'] and b['start'] < a['end']
+
+
+def _covered(entity: dict, spans: List[Tuple[int, int]]) -> bool:
+    """エンティティの全文字がいずれかの予測範囲に含まれるか（種別は問わない）"""
+    position = entity['start']
+    for start, end in spans:
+        if start > position:
+            break
+        if end > position:
+            position = end
+        if position >= entity['end']:
+            return True
+    return position >= entity['end']
+
+
+def score(gold: List[dict], predicted: List[dict]) -> Dict[str, Dict[str, Any]]:
+    """
+    エンティティ種別ごとの評価値を計算
+
+    - precision / recall: 範囲と種別が完全一致したものを正解とする
+    - recall_overlap: 同じ種別の予測と一部でも重なった正解の割合
+    - recall_masked: 種別を問わず全文字がマスキングされる正解の割合（漏えいしない割合）
+    """
+    spans = sorted((p['start'], p['end']) for p in predicted)
+    metrics = {}
+    for entity_type in ENTITY_TYPES:
+        gold_t = [g for g in gold if g['type'] == entity_type]
+        pred_t = [p for p in predicted if p['type'] == entity_type]
+        gold_keys = {(g['start'], g['end']) for g in gold_t}
+        exact = sum(1 for p in pred_t if (p['start'], p['end']) in gold_keys)
+        overlap = sum(1 for g in gold_t if any(_overlaps(g, p) for p in pred_t))
+        missed = [g for g in gold_t if not _covered(g, spans)]
+        metrics[entity_type] = {
+            'gold': len(gold_t),
+            'predicted': len(pred_t),
+            'precision': round(exact / len(pred_t), 4) if pred_t else None,
+            'recall': round(exact / len(gold_t), 4) if gold_t else None,
+            'recall_overlap': round(overlap / len(gold_t), 4) if gold_t else None,
+            'recall_masked': round(1 - len(missed) / len(gold_t), 4) if gold_t else None,
+            'missed': [{'text': g['text'], 'line': g['line']} for g in missed],
+        }
+    return metrics
+
+
+def _fmt(value: Optional[float], digits: int = 3) -> str:
+    return '-' if value is None else f'{value:.{digits}f}'
+
+
+def print_table(results: List[dict]) -> None:
+    header = f"{'model':<20}{'chunk':>7} {'exclude':<18}{'chars/s':>10}{'peakMB':>9}"
+    for entity_type in ENTITY_TYPES:
+        label = 'PER' if entity_type == 'PERSON' else 'ORG'
+        header += f"{label + ' P':>8}{label + ' R':>8}{label + ' Rm':>9}"
+    click.echo(header)
+    for result in results:
+        row = f"{result['model']:<20}{result['chunk_size']:>7} {','.join(result['exclude']) or '-':<18}"
+        if result.get('error'):
+            click.echo(row + f"  ✗ {result['error']}")
+            continue
+        row += f"{result['chars_per_second'] or 0:>10}{_fmt(result['peak_mb'], 0):>9}"
+        for entity_type in ENTITY_TYPES:
+            m = result['metrics'][entity_type]
+            row += f"{_fmt(m['precision']):>8}{_fmt(m['recall']):>8}{_fmt(m['recall_masked']):>9}"
+        click.echo(row)
+
+
+def meets_floor(result: dict, recall_floor: float) -> bool:
+    """全種別で recall_masked が下限以上か（正解がない種別は対象外）"""
+    if result.get('error'):
+        return False
+    return all(m['recall_masked'] is None or m['recall_masked'] >= recall_floor
+               for m in result['metrics'].values())
+
+
+@click.command()
+@click.option('--corpus', '-c', default=str(DEFAULT_CORPUS), type=click.Path(exists=True),
+              help='正解ラベル付きコーパス（JSONL）')
+@click.option('--models', '-m', multiple=True, default=DEFAULT_MODELS,
+              help='評価するspaCyモデル（複数指定可）')
+@click.option('--chunk-sizes', '-s', multiple=True, type=int, default=DEFAULT_CHUNK_SIZES,
+              help='評価するチャンクサイズ（バイト数、複数指定可）')
+@click.option('--exclude', '-x', multiple=True, default=[''],
+              help='ロードしないコンポーネント（カンマ区切りで1組、複数指定で組ごとに評価）')
+@click.option('--repeat', '-r', default=3, type=int, help='速度測定の繰り返し回数')
+@click.option('--recall-floor', default=0.95, type=float,
+              help='推奨設定に求める再現率（種別を問わずマスキングされた割合）の下限')
+@click.option('--output', '-o', default=None, help='結果を保存するJSONファイル')
+@click.option('--show-misses', is_flag=True, help='マスキングされなかった正解エンティティを表示')
+def main(corpus: str, models: tuple, chunk_sizes: tuple, exclude: tuple, repeat: int,
+         recall_floor: float, output: Optional[str], show_misses: bool):
+    """マスキング設定ごとの精度と処理速度を評価"""
+    text, gold = load_corpus(Path(corpus))
+    click.echo(f"コーパス: {corpus}（{len(text)}文字、正解エンティティ{len(gold)}件）")
+
+    configs = [(model, chunk_size, tuple(c for c in components.split(',') if c))
+               for model in models for chunk_size in chunk_sizes for components in exclude]
+    click.echo(f"{len(configs)}個の設定を評価します...\n")
+
+    results = []
+    context = mp.get_context('spawn')
+    for model, chunk_size, components in configs:
+        result = {'model': model, 'chunk_size': chunk_size, 'exclude': list(components)}
+        # モデルのメモリを独立に測るため、設定ごとに新しいプロセスで実行する
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                run = executor.submit(run_config, model, chunk_size, components, text, repeat).result()
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+                results.append(result)
+                click.echo(f"  ✗ {model} / {chunk_size}: {result['error']}")
+                continue
+        predicted = run.pop('predicted')
+        result.update(run)
+        result['metrics'] = score(gold, predicted)
+        results.append(result)
+        click.echo(f"  ✓ {model} / {chunk_size}: {result['chars_per_second']} chars/s")
+
+    click.echo('')
+    print_table(results)
+
+    if show_misses:
+        for result in results:
+            if result.get('error'):
+                continue
+            for entity_type, m in result['metrics'].items():
+                if m['missed']:
+                    missed = '、'.join(f"{item['text']}(L{item['line']})" for item in m['missed'])
+                    click.echo(f"\n{result['model']} / {result['chunk_size']} {entity_type} 漏れ: {missed}")
+
+    passing = [r for r in results if meets_floor(r, recall_floor)]
+    click.echo('')
+    if passing:
+        best = max(passing, key=lambda r: r['chars_per_second'] or 0)
+        click.echo(f"推奨: {best['model']}（チャンク {best['chunk_size']}バイト"
+                   f"{'、除外 ' + ','.join(best['exclude']) if best['exclude'] else ''}）"
+                   f" {best['chars_per_second']} chars/s")
+    else:
+        click.echo(f"再現率の下限 {recall_floor} を満たす設定はありません")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'corpus': corpus,
+                'chars': len(text),
+                'gold_entities': len(gold),
+                'recall_floor': recall_floor,
+                'repeat': repeat,
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        click.echo(f"結果を保存しました: {output}")
+
+
+if __name__ == '__main__':
+    main()
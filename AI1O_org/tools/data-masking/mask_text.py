@@ -8,22 +8,35 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
 import json
 
+from entity_map import DEFAULT_SHARDS, LABELS, EntityMap
+
 
 class TextMasker:
-    def __init__(self):
+    def __init__(self, model: Optional[str] = None, max_chunk_size: int = 40000,
+                 exclude: Tuple[str, ...] = (), entity_map: Optional[EntityMap] = None):
+        """
+        Args:
+            model: spaCyモデル名（省略時は ja_ginza、なければ ja_core_news_sm）
+            max_chunk_size: 1回の解析に渡す最大バイト数
+            exclude: ロードしないパイプラインコンポーネント名
+            entity_map: 指定すると [個人名_0042] のような名前ごとの仮名に置換する
+        """
         # GiNZAモデルをロード
-        try:
-            import ja_ginza
-            self.nlp = spacy.load("ja_ginza")
-        except (ImportError, OSError):
+        if model:
+            self.nlp = spacy.load(model, exclude=list(exclude))
+        else:
             try:
-                # 代替モデル名を試す
-                self.nlp = spacy.load("ja_core_news_sm")
-            except OSError:
-                click.echo("GiNZAモデルがインストールされていません。")
-                click.echo("以下のコマンドで依存関係をインストールしてください:")
-                click.echo("pip install ginza ja-ginza")
-                raise
+                import ja_ginza
+                self.nlp = spacy.load("ja_ginza", exclude=list(exclude))
+            except (ImportError, OSError):
+                try:
+                    # 代替モデル名を試す
+                    self.nlp = spacy.load("ja_core_news_sm", exclude=list(exclude))
+                except OSError:
+                    click.echo("GiNZAモデルがインストールされていません。")
+                    click.echo("以下のコマンドで依存関係をインストールしてください:")
+                    click.echo("pip install ginza ja-ginza")
+                    raise
         
         # spaCyのNERラベルをPresidioのエンティティタイプにマッピング
         self.entity_mapping = {
@@ -36,7 +49,10 @@ class TextMasker:
         }
         
         # チャンクサイズを設定（バイト数）
-        self.max_chunk_size = 40000  # 40KB（安全マージンを持たせる）
+        self.max_chunk_size = max_chunk_size  # 既定は40KB（安全マージンを持たせる）
+
+        # 仮名化用の対応表（Noneの場合は [個人名] / [会社名] に置換）
+        self.entity_map = entity_map
         
     def split_text_into_chunks(self, text: str) -> List[tuple[str, int]]:
         """テキストを適切なサイズのチャンクに分割"""
@@ -89,36 +105,43 @@ class TextMasker:
                 
         return results
         
-    def mask_text(self, text: str) -> str:
-        """テキスト内の個人名と会社名をマスキング"""
+    def find_entities(self, text: str) -> List[dict]:
+        """テキスト全体から個人名・会社名を抽出（大きなテキストはチャンクごとに解析）"""
         # テキストが短い場合は直接処理
         text_size = len(text.encode('utf-8'))
         if text_size <= self.max_chunk_size:
-            results = self.analyze_japanese_text(text)
-        else:
-            # 大きなテキストはチャンクに分割して処理
-            chunks = self.split_text_into_chunks(text)
-            results = []
-            
-            for chunk_text, offset in chunks:
-                chunk_results = self.analyze_japanese_text(chunk_text, offset)
-                results.extend(chunk_results)
+            return self.analyze_japanese_text(text)
+
+        # 大きなテキストはチャンクに分割して処理
+        results = []
+        for chunk_text, offset in self.split_text_into_chunks(text):
+            results.extend(self.analyze_japanese_text(chunk_text, offset))
+        return results
+        
+    def mask_text(self, text: str) -> str:
+        """テキスト内の個人名と会社名をマスキング"""
+        results = self.find_entities(text)
         
         if not results:
             return text
             
         # resultsを開始位置でソート（降順）
+        results = [r for r in results if r["entity_type"] in LABELS]
         results.sort(key=lambda x: x["start"], reverse=True)
+
+        # 仮名化する場合は、テキスト中のエンティティをまとめて対応表から引く
+        tokens = {}
+        if self.entity_map is not None:
+            tokens = self.entity_map.lookup(
+                (r["entity_type"], text[r["start"]:r["end"]]) for r in results)
         
         # テキストを置換
         masked_text = text
         for result in results:
-            if result["entity_type"] == "PERSON":
-                replacement = "[個人名]"
-            elif result["entity_type"] == "ORGANIZATION":
-                replacement = "[会社名]"
+            if self.entity_map is not None:
+                replacement = tokens[(result["entity_type"], text[result["start"]:result["end"]])]
             else:
-                continue
+                replacement = f"[{LABELS[result['entity_type']]}]"
                 
             masked_text = (
                 masked_text[:result["start"]] + 
@@ -171,10 +194,11 @@ class TextMasker:
 _masker: Optional[TextMasker] = None
 
 
-def init_worker():
-    """ワーカープロセスの初期化関数"""
+def init_worker(entity_map_path: Optional[str] = None):
+    """ワーカープロセスの初期化関数（entity_map_pathを指定すると仮名化する）"""
     global _masker
-    _masker = TextMasker()
+    entity_map = EntityMap(entity_map_path) if entity_map_path else None
+    _masker = TextMasker(entity_map=entity_map)
 
 
 def process_file_worker(args: Tuple[Path, Path, Path, bool, bool]) -> Tuple[bool, Optional[Path], str]:
@@ -266,7 +290,14 @@ def process_file(masker: TextMasker, input_path: Path, output_path: Path, keep_f
               help='ファイル名をマスキングしない')
 @click.option('--keep-original', '-K', is_flag=True, default=True,
               help='元ファイルを削除しない')
-def main(input_dir: str, output_dir: str, extensions: tuple, workers: Optional[int], keep_filename: bool, keep_original: bool):
+@click.option('--pseudonymize', '-p', is_flag=True,
+              help='[個人名_0042] のように名前ごとに一貫した仮名に置換する')
+@click.option('--entity-map', '-m', default='entity_map',
+              help='仮名化の対応表フォルダ（実行をまたいで同じ仮名を使う）')
+@click.option('--map-shards', default=DEFAULT_SHARDS, type=int,
+              help='対応表を新規作成する場合のシャード数')
+def main(input_dir: str, output_dir: str, extensions: tuple, workers: Optional[int], keep_filename: bool, keep_original: bool,
+         pseudonymize: bool, entity_map: str, map_shards: int):
     """テキストファイル内の会社名と個人名をマスキングするCLIツール"""
     
     input_path = Path(input_dir)
@@ -294,6 +325,13 @@ def main(input_dir: str, output_dir: str, extensions: tuple, workers: Optional[i
         workers = mp.cpu_count()
     
     click.echo(f"{len(files_to_process)}個のファイルを{workers}個のワーカーで並列処理します...")
+
+    # 仮名化する場合は、ワーカー起動前に対応表を作成しておく
+    entity_map_path = None
+    if pseudonymize:
+        EntityMap(entity_map, map_shards).close()
+        entity_map_path = entity_map
+        click.echo(f"仮名化の対応表: {entity_map}")
     
     # タスクリストを準備（各ファイルの処理に必要な引数をタプルで作成）
     tasks = []
@@ -307,7 +345,8 @@ def main(input_dir: str, output_dir: str, extensions: tuple, workers: Optional[i
     failed_count = 0
     
     # プロセスプールを作成して並列処理
-    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(entity_map_path,)) as executor:
         # すべてのタスクを投入
         future_to_file = {executor.submit(process_file_worker, task): task[0] for task in tasks}
         
@@ -1,34 +1,235 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Request, render_template, request, jsonify, send_file, Response
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 import os
 import json
-import subprocess
+import sys
+import gzip
+import shlex
+import shutil
+import hashlib
 import threading
 import time
-from datetime import datetime
-from config import CONFIG, AGENTS_FOLDER, APP_FOLDER_NAME, UPLOAD_FOLDER, OUTPUT_FOLDER, HOST, PORT, DEBUG
+from config import (CONFIG, AGENTS_FOLDER, APP_FOLDER_NAME, UPLOAD_FOLDER, OUTPUT_FOLDER, HOST, PORT, DEBUG,
+                    AGENT_CACHE_MAX_AGE, MAX_UPLOAD_SIZE, MAX_REQUEST_SIZE, ALLOWED_EXTENSIONS, UPLOAD_GC_INTERVAL, UPLOAD_PARTIAL_TTL,
+                    JOB_MAX_WORKERS, JOB_MAX_QUEUE, JOB_TIMEOUT, AGENT_COMMAND, MASK_SCRIPT, MASK_PYTHON,
+                    SSE_HEARTBEAT, SSE_BUFFER_SIZE, JOBS_FOLDER, JOB_RETENTION, STATIC_MAX_AGE,
+                    MASK_ON_UPLOAD, MASK_POOL_SIZE, MASK_EXTENSIONS,
+                    RESULT_MAX_SIZE, RESULT_MAX_FILES, RESULT_WRITE_WORKERS,
+                    SEARCH_ROOTS, SEARCH_INDEX_PATH, SEARCH_REFRESH_INTERVAL)
+from chunked_upload import (UploadError, safe_filename, check_extension, check_size, copy_stream,
+                            init_upload, get_upload, append_chunk, finalize_upload, abort_upload,
+                            cleanup_stale_uploads)
+from upload_store import HashingWriter, temp_file, store_file, link_existing, gc_blobs
+from jobs import JobManager, JobError
+from job_store import JobStore, JobSlots
+from events import EventBus, stream as event_stream, poll_stream
+from mask_pool import MaskPool
+from result_archive import ResultWriter, archive_type, create_result_dir, extract_archive
+from search_index import SearchIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# brotliはオプション（未インストールの場合はgzipのみ）
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# エンドポイントごとのリクエストボディの上限（それ以外は MAX_REQUEST_SIZE）
+# multipartのボディもWerkzeugが一時ファイルへ書き出す前に、受信しながら上限を確認する
+REQUEST_SIZE_LIMITS = {
+    'api_upload_chunk': MAX_UPLOAD_SIZE,
+    # 実行結果は展開後の合計サイズの上限にmultipartのヘッダー分の余裕を持たせる
+    'api_upload_result': RESULT_MAX_SIZE + 1024 * 1024,
+}
+
+# 受信中のパートごとにファイルの拡張子とサイズ（MAX_UPLOAD_SIZE）を確認するエンドポイント
+PART_LIMITED_ENDPOINTS = ('api_upload',)
+
+class LimitedFileStream:
+    """書き込みが上限を超えた時点でUploadErrorを送出する一時ファイル（multipartの1パート用）"""
+
+    def __init__(self, fp, limit):
+        self.fp = fp
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        check_size(self.size, self.limit)
+        return self.fp.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+class LimitedRequest(Request):
+    """エンドポイントごとに MAX_CONTENT_LENGTH とファイルパートの上限を切り替えるリクエスト"""
+
+    @property
+    def max_content_length(self):
+        return REQUEST_SIZE_LIMITS.get(self.endpoint, MAX_REQUEST_SIZE)
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limited = self.endpoint in PART_LIMITED_ENDPOINTS and filename
+        if limited:
+            # 許可されていないファイルはパートを一時ファイルへ書き出す前に拒否する
+            check_extension(safe_filename(filename), ALLOWED_EXTENSIONS)
+        stream = super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return LimitedFileStream(stream, MAX_UPLOAD_SIZE) if limited else stream
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 app = Flask(__name__, template_folder=os.path.join(script_dir, 'templates'))
+app.request_class = LimitedRequest
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_SIZE
 
-# グローバル変数でタスクの状態を管理
-task_status = {
-    'running': False,
-    'progress': 0,
-    'message': '',
-    'result': None,
-    'error': None
-}
+# ジョブ状態をファイルに書き出す間隔（logイベント時、秒）
+JOB_STATE_SAVE_INTERVAL = 0.5
+
+# ジョブ（エージェント実行・マスキング）の管理と進捗配信
+# 実行はジョブを受け付けたワーカープロセスで行い、状態はjob_storeで全ワーカーに共有する
+event_bus = EventBus(buffer_size=SSE_BUFFER_SIZE)
+# 起動時のカレントディレクトリに依存しないよう、相対パスはアプリのフォルダを基準にする
+job_store = JobStore(os.path.join(script_dir, JOBS_FOLDER))
+job_saved_at = {}
+
+def on_job_event(job, event, data):
+    """ジョブのイベントを配信し、共有ストアへ書き出す"""
+    event_id = event_bus.publish(job.id, event, data)
+    job_store.append_event(job.id, event_id, event, data)
+    now = time.time()
+    if event != 'log' or now - job_saved_at.get(job.id, 0) >= JOB_STATE_SAVE_INTERVAL:
+        job_saved_at[job.id] = now
+        job_store.save(job.to_dict())
+    if event == 'done':
+        job_saved_at.pop(job.id, None)
+
+# 同時実行数 JOB_MAX_WORKERS は全ワーカープロセスで共有する（ファイルロックが使えない環境ではプロセスごと）
+job_slots = JobSlots(job_store.folder, JOB_MAX_WORKERS) if fcntl is not None else None
+job_manager = JobManager(max_workers=JOB_MAX_WORKERS, max_queue=JOB_MAX_QUEUE, timeout=JOB_TIMEOUT,
+                         listener=on_job_event, cancel_check=job_store.cancel_requested, slots=job_slots)
+
+# アップロードファイルのマスキング（常駐TextMaskerワーカー）
+# gunicornではワーカープロセスごとにプールを持つため、ロードされるモデルは MASK_POOL_SIZE × SERVE_WORKERS 個になる
+mask_pool = MaskPool(UPLOAD_FOLDER, os.path.abspath(MASK_SCRIPT), workers=MASK_POOL_SIZE,
+                     listener=on_job_event, python=MASK_PYTHON or None)
+
+def mask_requested(data=None):
+    """アップロード時にマスキングするか（設定またはリクエストの mask パラメーター）"""
+    value = request.values.get('mask')
+    if value is None and data:
+        value = data.get('mask')
+    if value is None:
+        return MASK_ON_UPLOAD
+    return str(value).lower() in ['true', '1', 'yes']
+
+def start_masking(filename, digest):
+    """保存済みファイルのマスキングを開始し、レスポンス用の情報を返す
+
+    同じ内容のマスキング済みファイルがあれば、ジョブを作らずにそれを返す。
+    """
+    if os.path.splitext(filename)[1].lower() not in [e.lower() for e in MASK_EXTENSIONS]:
+        return None
+    masked_file = mask_pool.cached(digest)
+    if masked_file:
+        return {'file': filename, 'masked_file': masked_file, 'job_id': None}
+    job = mask_pool.submit(filename, digest)
+    return {'file': filename, 'masked_file': None, 'job_id': job.id}
+
+# エージェント出力の全文検索インデックス
+# 相対パスはアプリのフォルダを基準にする（起動時のカレントディレクトリに依存しない）
+search_index = SearchIndex(os.path.join(script_dir, SEARCH_INDEX_PATH),
+                           [os.path.join(script_dir, root) for root in SEARCH_ROOTS],
+                           refresh_interval=SEARCH_REFRESH_INTERVAL)
+
+def find_job(job_id):
+    """ジョブ状態を取得（このワーカーで実行中でなければ共有ストアから）"""
+    try:
+        return job_manager.get(job_id).to_dict()
+    except JobError:
+        job = job_store.load(job_id)
+        if job is None:
+            raise
+        return job
+
+def list_jobs():
+    """全ワーカーのジョブ一覧（ログなし）"""
+    jobs = {job['job_id']: job for job in job_store.list()}
+    for job in job_manager.list():
+        jobs[job.id] = job.to_dict()
+    result = []
+    for job in jobs.values():
+        job.pop('log', None)
+        result.append(job)
+    return sorted(result, key=lambda job: job['created_at'])
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """リクエストボディが上限を超えた場合もJSONで返す"""
+    return jsonify({
+        'success': False,
+        'error': f'リクエストのサイズが上限（{request.max_content_length}バイト）を超えています'
+    }), 413
+
+@app.url_defaults
+def static_cache_buster(endpoint, values):
+    """static/js・static/cssのURLに更新時刻を付けて、長期キャッシュできるようにする"""
+    if endpoint == 'static' and 'filename' in values:
+        filename = values['filename']
+        if filename.startswith(('js/', 'css/')):
+            try:
+                values['v'] = int(os.path.getmtime(os.path.join(app.static_folder, filename)))
+            except OSError:
+                pass
+
+@app.after_request
+def static_cache_headers(response):
+    """バージョン付きの静的ファイルに長期キャッシュヘッダーを付与"""
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.no_cache = None
+        response.cache_control.immutable = True
+    return response
+
+def extract_description(content):
+    """Markdownの内容からエージェントの説明を抽出"""
+    description = ''
+
+    # YAMLフロントマターから説明を抽出
+    if content.startswith('---'):
+        lines = content.split('\n')
+        for line in lines[1:]:
+            if line.startswith('description:'):
+                description = line.replace('description:', '').strip()
+                break
+            elif line.strip() == '---':
+                break
+
+    return description
+
+def sort_agent_files(md_files):
+    """ファイル名順ソート（readme.mdを最初に、数字プレフィックス優先）"""
+    def sort_key(filename):
+        if filename.lower() == 'readme.md':
+            return '00_readme'
+        return filename
+
+    return sorted(md_files, key=sort_key)
 
 def get_available_agents():
-    """利用可能なエージェント一覧を取得"""
+    """利用可能なエージェント一覧を取得（メタデータのみ）
+
+    本文は /api/agents/<name> から個別に取得する。
+    """
     agents_dir = AGENTS_FOLDER
     agents = []
     
     if os.path.exists(agents_dir):
-        processed_folders = set()
-        
         for root, dirs, files in os.walk(agents_dir):
             # templatesフォルダをスキップ
             if 'templates' in root:
@@ -40,7 +241,6 @@ def get_available_agents():
             if not md_files:
                 continue
                 
-            # フォルダ内に複数のmdファイルがある場合は結合、単一ファイルの場合はそのまま
             if relative_path == '.':
                 # ルートディレクトリの場合は個別ファイルとして処理
                 for file in md_files:
@@ -49,91 +249,189 @@ def get_available_agents():
                     try:
                         with open(file_path, 'r', encoding='utf-8') as f:
                             content = f.read()
-                            description = ''
-                            
-                            # YAMLフロントマターから説明を抽出
-                            if content.startswith('---'):
-                                lines = content.split('\n')
-                                for line in lines[1:]:
-                                    if line.startswith('description:'):
-                                        description = line.replace('description:', '').strip()
-                                        break
-                                    elif line.strip() == '---':
-                                        break
-                            
-                            # 説明が見つからない場合、最初の段落を使用
-                            if not description:
-                                lines = content.split('\n')
-                                for line in lines:
-                                    if line.strip() and not line.startswith('#') and not line.startswith('---'):
-                                        description = line.strip()
-                                        break
-                            
-                            # 長すぎる場合は切り詰める
-                            if len(description) > 100:
-                                description = description[:100] + '...'
-                            
-                            agents.append({
-                                'name': agent_name,
-                                'display_name': agent_name.replace('-', ' ').title(),
-                                'description': description or 'エージェントの説明を読み込めませんでした'
-                            })
+                        description = extract_description(content)
+                        
+                        # 説明が見つからない場合、最初の段落を使用
+                        if not description:
+                            lines = content.split('\n')
+                            for line in lines:
+                                if line.strip() and not line.startswith('#') and not line.startswith('---'):
+                                    description = line.strip()
+                                    break
                     except Exception as e:
-                        agents.append({
-                            'name': agent_name,
-                            'display_name': agent_name.replace('-', ' ').title(),
-                            'description': 'エージェントの説明を読み込めませんでした'
-                        })
-            else:
-                # サブフォルダの場合は全mdファイルを結合して1つのエージェントとして処理
-                if relative_path not in processed_folders:
-                    processed_folders.add(relative_path)
-                    agent_name = relative_path
-                    
-                    # ファイル名順ソート（readme.mdを最初に、数字プレフィックス優先）
-                    def sort_key(filename):
-                        if filename.lower() == 'readme.md':
-                            return '00_readme'
-                        return filename
-                    
-                    sorted_files = sorted(md_files, key=sort_key)
-                    
-                    # 全mdファイルの内容を結合
-                    combined_content = ""
-                    first_description = ""
-                    
-                    for file in sorted_files:
-                        file_path = os.path.join(root, file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                file_content = f.read()
-                                combined_content += f"\n\n# {file}\n\n{file_content}"
-                                
-                                # 最初のファイルの説明を取得
-                                if not first_description and file_content.startswith('---'):
-                                    lines = file_content.split('\n')
-                                    for line in lines[1:]:
-                                        if line.startswith('description:'):
-                                            first_description = line.replace('description:', '').strip()
-                                            break
-                                        elif line.strip() == '---':
-                                            break
-                        except Exception as e:
-                            combined_content += f"\n\n# {file}\n\nファイル読み込みエラー: {e}"
+                        description = ''
                     
                     # 長すぎる場合は切り詰める
-                    if len(first_description) > 100:
-                        first_description = first_description[:100] + '...'
+                    if len(description) > 100:
+                        description = description[:100] + '...'
                     
                     agents.append({
                         'name': agent_name,
                         'display_name': agent_name.replace('-', ' ').title(),
-                        'description': first_description or f'{len(sorted_files)}個のファイルを含むエージェント',
-                        'content': combined_content
+                        'description': description or 'エージェントの説明を読み込めませんでした'
                     })
+            else:
+                # サブフォルダの場合は最初のファイルの説明のみ読み込む
+                agent_name = relative_path
+                sorted_files = sort_agent_files(md_files)
+                first_description = ""
+                
+                for file in sorted_files:
+                    file_path = os.path.join(root, file)
+                    try:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            first_description = extract_description(f.read())
+                    except Exception as e:
+                        continue
+                    if first_description:
+                        break
+                
+                # 長すぎる場合は切り詰める
+                if len(first_description) > 100:
+                    first_description = first_description[:100] + '...'
+                
+                agents.append({
+                    'name': agent_name,
+                    'display_name': agent_name.replace('-', ' ').title(),
+                    'description': first_description or f'{len(sorted_files)}個のファイルを含むエージェント'
+                })
     
     return agents
 
+def get_agent_content(agent_name):
+    """エージェント本文を取得（フォルダの場合は全mdファイルを結合）
+
+    見つからない場合は None を返す。
+    """
+    agents_dir = os.path.abspath(AGENTS_FOLDER)
+    target = os.path.abspath(os.path.join(agents_dir, agent_name))
+
+    # agentsフォルダ外・templatesフォルダへのアクセスを拒否
+    if os.path.commonpath([agents_dir, target]) != agents_dir or target == agents_dir:
+        return None
+    if 'templates' in os.path.relpath(target, agents_dir).split(os.sep):
+        return None
+
+    if os.path.isdir(target):
+        md_files = [f for f in os.listdir(target)
+                    if f.endswith('.md') and not f.startswith('templates')
+                    and os.path.isfile(os.path.join(target, f))]
+        if not md_files:
+            return None
+
+        # 全mdファイルの内容を結合
+        combined_content = ""
+        for file in sort_agent_files(md_files):
+            file_path = os.path.join(target, file)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    combined_content += f"\n\n# {file}\n\n{f.read()}"
+            except Exception as e:
+                combined_content += f"\n\n# {file}\n\nファイル読み込みエラー: {e}"
+        return combined_content
+
+    # ルート直下の単一ファイルエージェント
+    file_path = target + '.md'
+    if os.path.dirname(file_path) == agents_dir and os.path.isfile(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    return None
+
+def compressed_response(body, mimetype, max_age=AGENT_CACHE_MAX_AGE):
+    """ETag・Cache-Control付きで、Accept-Encodingに応じて圧縮したレスポンスを返す
+
+    圧縮形式ごとに本文のバイト列が異なるため、ETagにも圧縮形式を含める。
+    """
+    raw = body.encode('utf-8')
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+    elif accepted['gzip']:
+        encoding = 'gzip'
+    else:
+        encoding = None
+    etag = hashlib.sha256(raw).hexdigest()[:32]
+    if encoding:
+        etag += '-' + encoding
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if encoding == 'br':
+            data = brotli.compress(raw)
+        elif encoding == 'gzip':
+            data = gzip.compress(raw, compresslevel=6)
+        else:
+            data = raw
+
+        response = Response(data, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def upload_gc_loop():
+    """未参照blob・放置された分割アップロード・古いジョブ記録を定期的に削除"""
+    while True:
+        time.sleep(UPLOAD_GC_INTERVAL)
+        # メモリ上のジョブ記録はワーカーごとに持つため、ロックに関係なく各プロセスで削除する
+        pruned = job_manager.prune(JOB_RETENTION)
+        dropped = event_bus.prune(JOB_RETENTION)
+        if pruned or dropped:
+            print(f"🧹 Job GC: {len(pruned)} finished jobs, {len(dropped)} event buffers released from memory")
+        # 複数ワーカーで起動している場合は、ロックを取れた1プロセスだけが実行する
+        lock_file = None
+        try:
+            lock_file = open(os.path.join(job_store.folder, '.gc.lock'), 'w')
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+            upload_folder = app.config['UPLOAD_FOLDER']
+            removed_uploads = cleanup_stale_uploads(upload_folder, UPLOAD_PARTIAL_TTL)
+            removed_blobs = gc_blobs(upload_folder)
+            if removed_uploads or removed_blobs:
+                print(f"🧹 Upload GC: {removed_blobs} blobs, {removed_uploads} partial uploads removed")
+            removed_jobs = job_store.cleanup(JOB_RETENTION)
+            if removed_jobs:
+                print(f"🧹 Job GC: {removed_jobs} finished jobs removed")
+        except Exception as e:
+            print(f"❌ Upload GC failed: {e}")
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+def start_upload_gc():
+    """アップロードGCをバックグラウンドスレッドで開始"""
+    thread = threading.Thread(target=upload_gc_loop, name='upload-gc', daemon=True)
+    thread.start()
+    return thread
+
+def prepare_app():
+    """起動前の準備（必要なディレクトリの作成とagentsフォルダの確認）"""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    
+    # agentsフォルダの存在確認
+    agents_dir = AGENTS_FOLDER
+    print(f"🔍 Checking agents directory: {os.path.abspath(agents_dir)}")
+    if os.path.exists(agents_dir):
+        agent_files = []
+        for root, dirs, files in os.walk(agents_dir):
+            if 'templates' in root:
+                continue
+            for file in files:
+                if file.endswith('.md') and not file.startswith('templates'):
+                    agent_files.append(file)
+        print(f"✅ Found {len(agent_files)} agent files: {agent_files}")
+    else:
+        print(f"❌ Agents directory not found: {os.path.abspath(agents_dir)}")
+
 def generate_claude_code_command(agent_type, prompt, input_files, output_path):
     """Claude Codeで実行するためのコマンドを生成"""
     
@@ -195,6 +493,85 @@ def generate_claude_code_command(agent_type, prompt, input_files, output_path):
         'input_files': file_paths
     }
 
+def build_agent_job(data):
+    """エージェント実行ジョブのコマンドを生成"""
+    agent_type = data.get('agent')
+    prompt = data.get('prompt', '')
+    if not agent_type:
+        raise JobError('エージェントを選択してください')
+    if not prompt.strip():
+        raise JobError('プロンプトを入力してください')
+
+    output_path = data.get('output_path', app.config['OUTPUT_FOLDER'])
+    command_data = generate_claude_code_command(agent_type, prompt, data.get('input_files', []), output_path)
+    agent_prompt = (f"Task toolで {agent_type} エージェント（subagent_type: {agent_type}）を使用して、"
+                    f"次のタスクを実行してください。\n\n{command_data['formatted_prompt']}")
+
+    argv = shlex.split(AGENT_COMMAND) + [agent_prompt]
+    cwd = os.path.dirname(os.path.abspath(AGENTS_FOLDER))
+    params = {'agent': agent_type, 'output_path': output_path, 'input_files': command_data['input_files']}
+    return argv, cwd, params, None
+
+def mask_progress(line, job):
+    """mask_text.py の出力から進捗（%）を計算"""
+    if 'ファイルを' in line and '個のワーカーで並列処理します' in line:
+        job.counters['total'] = int(line.split('個のファイルを')[0].strip() or 0)
+        job.counters['done'] = 0
+    elif line.lstrip().startswith(('✓', '✗')) and job.counters.get('total'):
+        job.counters['done'] += 1
+        return job.counters['done'] * 100 / job.counters['total']
+    return None
+
+def resolve_job_dir(base, path, name):
+    """ジョブに渡すフォルダを base からの相対パスとして解決（base の外は拒否）"""
+    base = os.path.realpath(base)
+    target = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, target]) != base:
+        raise JobError(f'{name} は {os.path.basename(base)} フォルダ内を指定してください')
+    return target
+
+def build_mask_job(data):
+    """マスキングジョブのコマンドを生成
+
+    入力はアップロードフォルダ内、出力は出力フォルダ内に限る。
+    """
+    if not data.get('input_dir') or not data.get('output_dir'):
+        raise JobError('input_dir と output_dir を指定してください')
+    input_dir = resolve_job_dir(app.config['UPLOAD_FOLDER'], data['input_dir'], 'input_dir')
+    output_dir = resolve_job_dir(app.config['OUTPUT_FOLDER'], data['output_dir'], 'output_dir')
+    if not os.path.isdir(input_dir):
+        raise JobError(f'input_dir が見つかりません: {data["input_dir"]}', 404)
+
+    script = os.path.abspath(MASK_SCRIPT)
+    argv = [MASK_PYTHON or sys.executable, script, '-i', input_dir, '-o', output_dir]
+    for ext in data.get('extensions') or ['.txt', '.md']:
+        argv.extend(['-e', ext])
+    if data.get('workers'):
+        argv.extend(['-w', str(int(data['workers']))])
+    if data.get('keep_filename'):
+        argv.append('-k')
+    params = {'input_dir': input_dir, 'output_dir': output_dir}
+    return argv, os.path.dirname(script), params, mask_progress
+
+def job_timeout(value):
+    """リクエストで指定されたタイムアウト（秒）を検証し、JOB_TIMEOUT を上限にする"""
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError(value)
+        timeout = int(str(value).strip())
+    except (TypeError, ValueError):
+        raise JobError('timeout は正の整数（秒）で指定してください')
+    if timeout <= 0:
+        raise JobError('timeout は正の整数（秒）で指定してください')
+    return min(timeout, JOB_TIMEOUT) if JOB_TIMEOUT else timeout
+
+JOB_BUILDERS = {
+    'agent': build_agent_job,
+    'mask': build_mask_job
+}
+
 @app.route('/')
 def index():
     """メインページ"""
@@ -203,31 +580,181 @@ def index():
 
 @app.route('/api/agents')
 def api_agents():
-    """エージェント一覧API"""
+    """エージェント一覧API（name・descriptionのみ）"""
     return jsonify(get_available_agents())
 
+@app.route('/api/agents/<path:agent_name>')
+def api_agent_content(agent_name):
+    """エージェント本文取得API（圧縮・キャッシュ対応）"""
+    content = get_agent_content(agent_name)
+    if content is None:
+        return jsonify({
+            'success': False,
+            'error': f'エージェントが見つかりません: {agent_name}'
+        }), 404
+
+    body = json.dumps({
+        'success': True,
+        'name': agent_name,
+        'content': content
+    }, ensure_ascii=False)
+    return compressed_response(body, 'application/json')
+
 @app.route('/api/upload', methods=['POST'])
 def api_upload():
     """ファイルアップロードAPI"""
     try:
         uploaded_files = []
+        mask_jobs = []
         for file in request.files.getlist('files'):
             if file.filename:
-                filename = file.filename
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filename = safe_filename(file.filename)
+                check_extension(filename, ALLOWED_EXTENSIONS)
+                upload_folder = app.config['UPLOAD_FOLDER']
+                fp, tmp_path = temp_file(upload_folder)
+                try:
+                    with fp:
+                        writer = HashingWriter(fp)
+                        copy_stream(file.stream, writer, MAX_UPLOAD_SIZE)
+                    filename = store_file(upload_folder, tmp_path, filename, writer.hexdigest())
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
                 uploaded_files.append(filename)
+                if mask_requested():
+                    mask_jobs.append(start_masking(filename, writer.hexdigest()))
         
         return jsonify({
             'success': True,
-            'files': uploaded_files
+            'files': uploaded_files,
+            'masking': [m for m in mask_jobs if m]
+        })
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/upload/init', methods=['POST'])
+def api_upload_init():
+    """分割アップロード開始API"""
+    try:
+        data = request.json or {}
+
+        # 同じ内容が保存済みなら、データを送らずに完了する
+        if data.get('sha256'):
+            filename = safe_filename(data.get('filename'))
+            check_extension(filename, ALLOWED_EXTENSIONS)
+            try:
+                size = int(data.get('size'))
+            except (TypeError, ValueError):
+                raise UploadError('sha256を指定する場合はsizeも指定してください')
+            check_size(size, MAX_UPLOAD_SIZE)
+            filename = link_existing(app.config['UPLOAD_FOLDER'], data['sha256'], filename, size)
+            if filename:
+                masking = start_masking(filename, data['sha256'].lower()) if mask_requested(data) else None
+                return jsonify({
+                    'success': True,
+                    'complete': True,
+                    'files': [filename],
+                    'masking': [masking] if masking else []
+                })
+
+        upload = init_upload(app.config['UPLOAD_FOLDER'], data.get('filename'), data.get('size'),
+                             MAX_UPLOAD_SIZE, ALLOWED_EXTENSIONS)
+        return jsonify(dict(upload, success=True, complete=False))
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/upload/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def api_upload_chunk(upload_id):
+    """分割アップロードAPI
+
+    GET: 受信済みオフセット取得（再開用）
+    PATCH: Upload-Offsetヘッダーの位置にリクエストボディを追記
+    DELETE: アップロード中止
+    """
+    try:
+        upload_folder = app.config['UPLOAD_FOLDER']
+        if request.method == 'GET':
+            upload = get_upload(upload_folder, upload_id)
+        elif request.method == 'PATCH':
+            upload = append_chunk(upload_folder, upload_id,
+                                  request.headers.get('Upload-Offset'), request.stream)
+        else:
+            abort_upload(upload_folder, upload_id)
+            return jsonify({'success': True})
+        return jsonify(dict(upload, success=True))
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+def api_upload_finalize(upload_id):
+    """分割アップロード完了API"""
+    try:
+        filename, digest = finalize_upload(app.config['UPLOAD_FOLDER'], upload_id)
+        masking = start_masking(filename, digest) if mask_requested(request.get_json(silent=True)) else None
+        return jsonify({
+            'success': True,
+            'files': [filename],
+            'masking': [masking] if masking else []
         })
+    except UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/mask/<job_id>')
+def api_mask_result(job_id):
+    """マスキング済みファイル取得API（完了前は202で状態を返す）"""
+    try:
+        job = find_job(job_id)
+        if job['kind'] != 'upload_mask':
+            raise JobError(f'ジョブが見つかりません: {job_id}', 404)
+        if not job['finished_at']:
+            return jsonify(dict(job, success=True)), 202
+        if job['state'] != 'succeeded':
+            return jsonify(dict(job, success=False)), 500
+
+        masked_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], job['result']['masked_file']))
+        return send_file(masked_path, mimetype='text/plain', download_name=job['result']['masked_file'])
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+
 @app.route('/api/prepare', methods=['POST'])
 def api_prepare():
     """Claude Code実行準備API"""
@@ -266,57 +793,231 @@ def api_prepare():
 
 @app.route('/api/upload_result', methods=['POST'])
 def api_upload_result():
-    """実行結果アップロードAPI"""
+    """実行結果アップロードAPI
+
+    result_files（複数ファイル、zip/tarアーカイブも可）またはリクエストボディの
+    zip/tarアーカイブを1つの結果フォルダに保存し、サイズとSHA-256のマニフェストを返す。
+    """
+    result_dir = None
     try:
-        uploaded_files = []
         output_folder = app.config['OUTPUT_FOLDER']
-        
-        # 結果ファイルを保存
-        for file in request.files.getlist('result_files'):
-            if file.filename:
-                # タイムスタンプ付きフォルダを作成
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                result_dir = os.path.join(output_folder, f'claude_code_result_{timestamp}')
-                os.makedirs(result_dir, exist_ok=True)
-                
-                filename = file.filename
-                filepath = os.path.join(result_dir, filename)
-                file.save(filepath)
-                uploaded_files.append({
-                    'filename': filename,
-                    'path': filepath,
-                    'size': os.path.getsize(filepath)
-                })
-        
+        files = [f for f in request.files.getlist('result_files') if f.filename]
+        body_kind = None if files else archive_type(content_type=request.content_type)
+        if not files and not body_kind:
+            raise UploadError('result_files またはzip/tarアーカイブを送信してください')
+
+        result_dir = create_result_dir(output_folder)
+        writer = ResultWriter(result_dir, RESULT_MAX_SIZE, RESULT_MAX_FILES)
+
+        if body_kind:
+            extract_archive(body_kind, request.stream, writer, RESULT_WRITE_WORKERS)
+        for file in files:
+            kind = archive_type(file.filename)
+            if kind:
+                extract_archive(kind, file.stream, writer, RESULT_WRITE_WORKERS)
+            else:
+                writer.write(safe_filename(file.filename), file.stream)
+
+        # 検索インデックスに追加（失敗してもアップロード自体は成功とする）
+        try:
+            search_index.index_files(entry['path'] for entry in writer.manifest)
+        except Exception as e:
+            print(f"❌ Search index update failed: {e}")
+
         return jsonify({
             'success': True,
-            'uploaded_files': uploaded_files,
-            'result_folder': result_dir if uploaded_files else None
+            'uploaded_files': writer.sorted_manifest(),
+            'total_size': writer.total,
+            'result_folder': result_dir
         })
         
+    except UploadError as e:
+        if result_dir:
+            shutil.rmtree(result_dir, ignore_errors=True)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+    except Exception as e:
+        if result_dir:
+            shutil.rmtree(result_dir, ignore_errors=True)
+        if isinstance(e, HTTPException):
+            raise
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/search')
+def api_search():
+    """出力ドキュメントの全文検索API"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({
+            'success': False,
+            'error': '検索語を入力してください'
+        }), 400
+
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+
+    try:
+        started = time.perf_counter()
+        # 前回から一定時間経過していれば、対象フォルダの変更を反映してから検索
+        search_index.refresh()
+        results = search_index.search(query, limit=limit)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'took_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+def api_jobs():
+    """ジョブ一覧取得・ジョブ投入API"""
+    if request.method == 'GET':
+        return jsonify({
+            'success': True,
+            'jobs': list_jobs()
+        })
+
+    try:
+        data = request.json or {}
+        builder = JOB_BUILDERS.get(data.get('type'))
+        if builder is None:
+            raise JobError(f'不明なジョブ種別です: {data.get("type")}')
+
+        timeout = job_timeout(data.get('timeout'))
+        argv, cwd, params, progress_parser = builder(data)
+        job = job_manager.submit(data['type'], argv, cwd=cwd, timeout=timeout,
+                                 params=params, progress_parser=progress_parser)
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'job': job.to_dict()
+        }), 202
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_job_cancel(job_id):
+    """ジョブキャンセルAPI"""
+    try:
+        try:
+            job = job_manager.cancel(job_id).to_dict()
+        except JobError:
+            # 他のワーカーで実行中のジョブはキャンセル要求を書き出す
+            job = find_job(job_id)
+            if not job.get('finished_at'):
+                job_store.request_cancel(job_id)
+        return jsonify({
+            'success': True,
+            'job': job
+        })
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+
+@app.route('/api/jobs/<job_id>/events')
+def api_job_events(job_id):
+    """ジョブ進捗のServer-Sent Events API
+
+    state / log / done イベントをプッシュする。再接続時は Last-Event-ID 以降を再送する。
+    """
+    try:
+        job = find_job(job_id)
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+
+    if event_bus.has_topic(job_id):
+        subscription = event_bus.subscribe(job_id, last_event_id)
+        if job['finished_at'] and not subscription.backlog:
+            # 完了済みで送るイベントがない場合、204で再接続を止める
+            event_bus.unsubscribe(subscription)
+            return Response(status=204)
+        events = event_stream(event_bus, subscription, heartbeat=SSE_HEARTBEAT)
+    else:
+        # 他のワーカーで実行中のジョブは共有ストアのイベントを読む
+        if job['finished_at']:
+            stored, _ = job_store.read_events(job_id)
+            if not any(item['id'] > last_event_id for item in stored or ()):
+                return Response(status=204)
+        events = poll_stream(lambda offset: job_store.read_events(job_id, offset),
+                             last_event_id, heartbeat=SSE_HEARTBEAT)
+
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/status')
 def api_status():
-    """タスク状態取得API"""
-    return jsonify(task_status)
+    """全ジョブの状態取得API"""
+    jobs = list_jobs()
+    return jsonify({
+        'running': any(job['running'] for job in jobs),
+        'jobs': jobs
+    })
+
+@app.route('/api/status/<job_id>')
+def api_job_status(job_id):
+    """ジョブ状態取得API"""
+    try:
+        return jsonify(dict(find_job(job_id), success=True))
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
 
 @app.route('/api/reset')
 def api_reset():
-    """タスク状態リセットAPI"""
-    global task_status
-    task_status = {
-        'running': False,
-        'progress': 0,
-        'message': '',
-        'result': None,
-        'error': None
-    }
-    return jsonify({'success': True})
+    """完了したジョブの記録を削除するAPI（他のジョブには影響しない）"""
+    try:
+        job_id = request.args.get('job_id')
+        if not job_id:
+            raise JobError('job_idを指定してください')
+        try:
+            job_manager.remove(job_id)
+        except JobError as e:
+            if e.status != 404:
+                raise
+            if not find_job(job_id).get('finished_at'):
+                raise JobError('実行中のジョブは削除できません', 409)
+        event_bus.drop(job_id)
+        job_store.remove(job_id)
+        return jsonify({'success': True})
+    except JobError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status
 
 
 if __name__ == '__main__':
@@ -330,24 +1031,15 @@ if __name__ == '__main__':
         print(f"📁 Changing to script directory: {script_dir}")
         os.chdir(script_dir)
     
-    # 必要なディレクトリを作成
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    # 必要なディレクトリを作成し、agentsフォルダを確認
+    prepare_app()
     
-    # agentsフォルダの存在確認
-    agents_dir = AGENTS_FOLDER
-    print(f"🔍 Checking agents directory: {os.path.abspath(agents_dir)}")
-    if os.path.exists(agents_dir):
-        agent_files = []
-        for root, dirs, files in os.walk(agents_dir):
-            if 'templates' in root:
-                continue
-            for file in files:
-                if file.endswith('.md') and not file.startswith('templates'):
-                    agent_files.append(file)
-        print(f"✅ Found {len(agent_files)} agent files: {agent_files}")
-    else:
-        print(f"❌ Agents directory not found: {os.path.abspath(agents_dir)}")
+    # 未参照blobのGCを開始（リローダーの親プロセスでは起動しない）
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_upload_gc()
+        # アップロード時マスキングが有効ならモデルを先にロードしておく
+        if MASK_ON_UPLOAD:
+            mask_pool.warm()
     
     print("🚀 AI1O Agent Web App starting...")
     print(f"📍 URL: http://{HOST}:{PORT}")
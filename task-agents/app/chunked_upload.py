@@ -0,0 +1,183 @@
+"""
+分割アップロード（init → chunk → finalize）の処理
+アップロード状態はディスク上に保存するため、中断しても再開でき、
+複数ワーカーからも同じ状態を参照できる
+"""
+import os
+import json
+import time
+import uuid
+
+from upload_store import store_file, hash_file
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ストリームからディスクへ書き込む単位
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """アップロード処理のエラー（HTTPステータスコード付き）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def safe_filename(filename):
+    """パス区切りを取り除いたファイル名を返す（日本語ファイル名はそのまま）"""
+    name = os.path.basename((filename or '').replace('\\', '/')).strip()
+    if name in ('', '.', '..') or '\x00' in name:
+        raise UploadError(f'不正なファイル名です: {filename}')
+    return name
+
+
+def check_extension(filename, allowed_extensions):
+    """拡張子が許可されているか確認"""
+    ext = os.path.splitext(filename)[1].lower()
+    if allowed_extensions and ext not in [e.lower() for e in allowed_extensions]:
+        raise UploadError(f'許可されていない拡張子です: {ext or "(なし)"}', 415)
+
+
+def check_size(size, max_size):
+    """サイズ上限を確認"""
+    if max_size and size > max_size:
+        raise UploadError(f'ファイルサイズが上限（{max_size}バイト）を超えています', 413)
+
+
+def copy_stream(stream, fp, limit, written=0):
+    """ストリームを一定サイズずつファイルへ書き込み、上限を超えたら中断
+
+    書き込み後の合計バイト数を返す。
+    """
+    while True:
+        buf = stream.read(STREAM_BUFFER_SIZE)
+        if not buf:
+            break
+        written += len(buf)
+        if written > limit:
+            raise UploadError(f'ファイルサイズが上限（{limit}バイト）を超えています', 413)
+        fp.write(buf)
+    return written
+
+
+def _partial_dir(upload_folder):
+    return os.path.join(upload_folder, '.partial')
+
+
+def _paths(upload_folder, upload_id):
+    # upload_idはuuid4の16進文字列のみ受け付ける
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except (ValueError, TypeError):
+        raise UploadError('アップロードIDが不正です', 404)
+    base = os.path.join(_partial_dir(upload_folder), upload_id)
+    return base + '.json', base + '.part'
+
+
+def _load_meta(upload_folder, upload_id):
+    meta_path, part_path = _paths(upload_folder, upload_id)
+    if not os.path.exists(meta_path) or not os.path.exists(part_path):
+        raise UploadError('アップロードが見つかりません', 404)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f), part_path
+
+
+def init_upload(upload_folder, filename, size, max_size, allowed_extensions):
+    """アップロードを開始し、状態を返す"""
+    filename = safe_filename(filename)
+    check_extension(filename, allowed_extensions)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('sizeを指定してください')
+    if size < 0:
+        raise UploadError('sizeが不正です')
+    check_size(size, max_size)
+
+    os.makedirs(_partial_dir(upload_folder), exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _paths(upload_folder, upload_id)
+    meta = {'upload_id': upload_id, 'filename': filename, 'size': size}
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return dict(meta, offset=0)
+
+
+def get_upload(upload_folder, upload_id):
+    """アップロード状態（受信済みバイト数）を返す"""
+    meta, part_path = _load_meta(upload_folder, upload_id)
+    return dict(meta, offset=os.path.getsize(part_path))
+
+
+def append_chunk(upload_folder, upload_id, offset, stream):
+    """チャンクを追記し、新しいオフセットを返す
+
+    offsetは受信済みバイト数と一致している必要がある（再送・並行書き込み対策）。
+    """
+    meta, part_path = _load_meta(upload_folder, upload_id)
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        raise UploadError('Upload-Offsetヘッダーに受信済みバイト数を指定してください')
+    with open(part_path, 'ab') as fp:
+        if fcntl is not None:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            current = fp.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadError(f'オフセットが一致しません（現在: {current}）', 409)
+            written = copy_stream(stream, fp, meta['size'], current)
+            fp.flush()
+        except UploadError:
+            # 上限超過時は受信済み位置まで戻す
+            fp.truncate(current)
+            raise
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+    return dict(meta, offset=written)
+
+
+def finalize_upload(upload_folder, upload_id):
+    """受信完了したファイルをストアに保存し、(ファイル名, SHA-256) を返す"""
+    meta, part_path = _load_meta(upload_folder, upload_id)
+    received = os.path.getsize(part_path)
+    if received != meta['size']:
+        raise UploadError(f'アップロードが完了していません（{received}/{meta["size"]}バイト）', 409)
+
+    digest = hash_file(part_path)
+    filename = store_file(upload_folder, part_path, meta['filename'], digest)
+    os.remove(_paths(upload_folder, upload_id)[0])
+    return filename, digest
+
+
+def abort_upload(upload_folder, upload_id):
+    """アップロードを中止して一時ファイルを削除"""
+    for path in _paths(upload_folder, upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def cleanup_stale_uploads(upload_folder, ttl):
+    """ttl秒以上更新されていない未完了アップロードを削除し、削除数を返す"""
+    partial_dir = _partial_dir(upload_folder)
+    if not os.path.isdir(partial_dir):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(partial_dir):
+        if entry.name.endswith('.json') and now - entry.stat().st_mtime >= ttl:
+            upload_id = entry.name[:-len('.json')]
+            part_path = os.path.join(partial_dir, upload_id + '.part')
+            # チャンク受信中は.partのmtimeが更新される
+            if os.path.exists(part_path) and now - os.path.getmtime(part_path) < ttl:
+                continue
+            abort_upload(upload_folder, upload_id)
+            removed += 1
+    return removed
@@ -16,10 +16,46 @@ DEFAULT_CONFIG = {
     'HOST': '127.0.0.1',
     'PORT': 5001,
     'DEBUG': True,
+
+    # 本番サーバー（serve.py）設定
+    'SERVE_WORKERS': 4,  # ワーカープロセス数
+    'SERVE_THREADS': 8,  # ワーカーごとのスレッド数（SSE接続もスレッドを1つ使う）
+    'SERVE_KEEPALIVE': 5,  # Keep-Alive接続の待機秒数
+    'SERVE_TIMEOUT': 120,  # 応答しないワーカーを再起動するまでの秒数
+    'SERVE_GRACEFUL_TIMEOUT': 30,  # 再起動時に処理中リクエストを待つ秒数
+    'SERVE_MAX_REQUESTS': 0,  # この回数ごとにワーカーを入れ替える（0で無効）
+    'STATIC_MAX_AGE': 365 * 24 * 60 * 60,  # static/js・static/cssのキャッシュ秒数
     
     # アプリ設定
     'MAX_UPLOAD_SIZE': 16 * 1024 * 1024,  # 16MB
-    'ALLOWED_EXTENSIONS': ['.txt', '.md', '.pdf', '.docx', '.json', '.csv']
+    'MAX_REQUEST_SIZE': 64 * 1024 * 1024,  # 1リクエストのボディの上限（/api/upload の複数ファイルの合計など）
+    'ALLOWED_EXTENSIONS': ['.txt', '.md', '.pdf', '.docx', '.json', '.csv'],
+    'RESULT_MAX_SIZE': 256 * 1024 * 1024,  # 実行結果アップロード1回あたりの展開後の合計サイズ
+    'RESULT_MAX_FILES': 5000,  # 実行結果アップロード1回あたりのファイル数
+    'RESULT_WRITE_WORKERS': 4,  # アーカイブ展開時の並列書き込み数
+    'AGENT_CACHE_MAX_AGE': 300,  # /api/agents/<name> のキャッシュ秒数
+    'UPLOAD_GC_INTERVAL': 3600,  # 未参照blob・未完了アップロードの掃除間隔（秒）
+    'UPLOAD_PARTIAL_TTL': 24 * 60 * 60,  # 未完了アップロードの保持期間（秒）
+
+    # ジョブ設定
+    'JOB_MAX_WORKERS': 2,  # 同時実行ジョブ数
+    'JOB_MAX_QUEUE': 20,  # 実行待ちジョブの上限
+    'JOB_TIMEOUT': 30 * 60,  # ジョブのタイムアウト（秒）
+    'AGENT_COMMAND': 'claude -p',  # エージェント実行コマンド（末尾にプロンプトを付与）
+    'MASK_SCRIPT': '../../AI1O_org/tools/data-masking/mask_text.py',
+    'MASK_PYTHON': '',  # マスキング用Python（空の場合はアプリと同じPython）
+    'MASK_ON_UPLOAD': False,  # アップロード時に常にマスキングする（リクエストの mask=true でも指定可）
+    'MASK_POOL_SIZE': 1,  # 常駐マスキングワーカー数（ワーカーごとにGiNZAモデルを保持）
+    'MASK_EXTENSIONS': ['.txt', '.md', '.json', '.jsonl', '.csv'],  # マスキング対象の拡張子
+    'SEARCH_ROOTS': ['../output', '../../AI1O_org/output'],  # 全文検索の対象フォルダ
+    'SEARCH_INDEX_PATH': '.search/index.sqlite3',  # 全文検索インデックスの保存先
+    'SEARCH_REFRESH_INTERVAL': 30,  # 検索時に対象フォルダの変更を確認する間隔（秒）
+    'JOBS_FOLDER': '.jobs',  # ワーカー間で共有するジョブ状態の保存先
+    'JOB_RETENTION': 7 * 24 * 60 * 60,  # 完了したジョブの記録の保持期間（秒）
+
+    # 進捗配信（SSE）設定
+    'SSE_HEARTBEAT': 15,  # ハートビート間隔（秒）
+    'SSE_BUFFER_SIZE': 500,  # 再接続用にジョブごとに保持するイベント数
 }
 
 def get_config():
@@ -30,11 +66,17 @@ def get_config():
     for key in config:
         env_value = os.environ.get(key)
         if env_value:
-            if key in ['PORT', 'MAX_UPLOAD_SIZE']:
+            if key in ['PORT', 'MAX_UPLOAD_SIZE', 'MAX_REQUEST_SIZE', 'AGENT_CACHE_MAX_AGE',
+                       'RESULT_MAX_SIZE', 'RESULT_MAX_FILES', 'RESULT_WRITE_WORKERS',
+                       'SERVE_WORKERS', 'SERVE_THREADS', 'SERVE_KEEPALIVE', 'SERVE_TIMEOUT',
+                       'SERVE_GRACEFUL_TIMEOUT', 'SERVE_MAX_REQUESTS', 'STATIC_MAX_AGE',
+                       'UPLOAD_GC_INTERVAL', 'UPLOAD_PARTIAL_TTL',
+                       'MASK_POOL_SIZE', 'SEARCH_REFRESH_INTERVAL', 'JOB_MAX_WORKERS', 'JOB_MAX_QUEUE', 'JOB_TIMEOUT', 'JOB_RETENTION',
+                       'SSE_HEARTBEAT', 'SSE_BUFFER_SIZE']:
                 config[key] = int(env_value)
-            elif key in ['DEBUG']:
+            elif key in ['DEBUG', 'MASK_ON_UPLOAD']:
                 config[key] = env_value.lower() in ['true', '1', 'yes']
-            elif key == 'ALLOWED_EXTENSIONS':
+            elif key in ['ALLOWED_EXTENSIONS', 'MASK_EXTENSIONS', 'SEARCH_ROOTS']:
                 config[key] = env_value.split(',')
             else:
                 config[key] = env_value
@@ -51,4 +93,36 @@ UPLOAD_FOLDER = CONFIG['UPLOAD_FOLDER']
 OUTPUT_FOLDER = CONFIG['OUTPUT_FOLDER']
 HOST = CONFIG['HOST']
 PORT = CONFIG['PORT']
-DEBUG = CONFIG['DEBUG']
\ No newline at end of file
+DEBUG = CONFIG['DEBUG']
+SERVE_WORKERS = CONFIG['SERVE_WORKERS']
+SERVE_THREADS = CONFIG['SERVE_THREADS']
+SERVE_KEEPALIVE = CONFIG['SERVE_KEEPALIVE']
+SERVE_TIMEOUT = CONFIG['SERVE_TIMEOUT']
+SERVE_GRACEFUL_TIMEOUT = CONFIG['SERVE_GRACEFUL_TIMEOUT']
+SERVE_MAX_REQUESTS = CONFIG['SERVE_MAX_REQUESTS']
+STATIC_MAX_AGE = CONFIG['STATIC_MAX_AGE']
+AGENT_CACHE_MAX_AGE = CONFIG['AGENT_CACHE_MAX_AGE']
+MAX_UPLOAD_SIZE = CONFIG['MAX_UPLOAD_SIZE']
+MAX_REQUEST_SIZE = CONFIG['MAX_REQUEST_SIZE']
+ALLOWED_EXTENSIONS = CONFIG['ALLOWED_EXTENSIONS']
+RESULT_MAX_SIZE = CONFIG['RESULT_MAX_SIZE']
+RESULT_MAX_FILES = CONFIG['RESULT_MAX_FILES']
+RESULT_WRITE_WORKERS = CONFIG['RESULT_WRITE_WORKERS']
+UPLOAD_GC_INTERVAL = CONFIG['UPLOAD_GC_INTERVAL']
+UPLOAD_PARTIAL_TTL = CONFIG['UPLOAD_PARTIAL_TTL']
+JOB_MAX_WORKERS = CONFIG['JOB_MAX_WORKERS']
+JOB_MAX_QUEUE = CONFIG['JOB_MAX_QUEUE']
+JOB_TIMEOUT = CONFIG['JOB_TIMEOUT']
+AGENT_COMMAND = CONFIG['AGENT_COMMAND']
+MASK_SCRIPT = CONFIG['MASK_SCRIPT']
+MASK_PYTHON = CONFIG['MASK_PYTHON']
+MASK_ON_UPLOAD = CONFIG['MASK_ON_UPLOAD']
+MASK_POOL_SIZE = CONFIG['MASK_POOL_SIZE']
+MASK_EXTENSIONS = CONFIG['MASK_EXTENSIONS']
+SEARCH_ROOTS = CONFIG['SEARCH_ROOTS']
+SEARCH_INDEX_PATH = CONFIG['SEARCH_INDEX_PATH']
+SEARCH_REFRESH_INTERVAL = CONFIG['SEARCH_REFRESH_INTERVAL']
+JOBS_FOLDER = CONFIG['JOBS_FOLDER']
+JOB_RETENTION = CONFIG['JOB_RETENTION']
+SSE_HEARTBEAT = CONFIG['SSE_HEARTBEAT']
+SSE_BUFFER_SIZE = CONFIG['SSE_BUFFER_SIZE']
\ No newline at end of file
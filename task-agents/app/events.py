@@ -0,0 +1,177 @@
+"""
+プロセス内の軽量pub/sub
+トピック（ジョブID）ごとに直近のイベントを保持し、購読者へプッシュする
+Server-Sent Events の Last-Event-ID による再接続時は保持分から再送する
+"""
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+
+class Event:
+    """1件のイベント"""
+
+    __slots__ = ('id', 'event', 'data')
+
+    def __init__(self, id, event, data):
+        self.id = id
+        self.event = event
+        self.data = data
+
+    def to_sse(self):
+        """SSE形式の文字列に変換"""
+        data = json.dumps(self.data, ensure_ascii=False)
+        return f'id: {self.id}\nevent: {self.event}\ndata: {data}\n\n'
+
+
+class Subscription:
+    """1クライアント分の購読"""
+
+    def __init__(self, topic, backlog, queue_size):
+        self.topic = topic
+        self.backlog = backlog
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class EventBus:
+    """トピックごとのイベント配信"""
+
+    def __init__(self, buffer_size=500, queue_size=1000):
+        self.buffer_size = buffer_size
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.counters = {}
+        self.updated = {}
+        self.subscribers = {}
+
+    def publish(self, topic, event, data):
+        """イベントを発行し、イベントIDを返す"""
+        with self.lock:
+            event_id = self.counters.get(topic, 0) + 1
+            self.counters[topic] = event_id
+            ev = Event(event_id, event, data)
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                buffer = self.buffers[topic] = deque(maxlen=self.buffer_size)
+            buffer.append(ev)
+            self.updated[topic] = time.monotonic()
+            subscribers = list(self.subscribers.get(topic, ()))
+
+        for sub in subscribers:
+            if sub.overflowed:
+                continue
+            try:
+                sub.queue.put_nowait(ev)
+            except queue.Full:
+                # 受信が遅いクライアントは切断し、再接続時にバッファから再送させる
+                sub.overflowed = True
+                self._wake(sub)
+        return event_id
+
+    def subscribe(self, topic, last_event_id=0):
+        """購読を開始（last_event_idより後の保持済みイベントをbacklogに入れる）"""
+        with self.lock:
+            backlog = [ev for ev in self.buffers.get(topic, ()) if ev.id > last_event_id]
+            sub = Subscription(topic, backlog, self.queue_size)
+            self.subscribers.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            subscribers = self.subscribers.get(sub.topic)
+            if subscribers is not None:
+                subscribers.discard(sub)
+                if not subscribers:
+                    del self.subscribers[sub.topic]
+
+    def drop(self, topic):
+        """トピックの保持イベントを破棄"""
+        with self.lock:
+            self.buffers.pop(topic, None)
+            self.counters.pop(topic, None)
+            self.updated.pop(topic, None)
+
+    def prune(self, max_age):
+        """購読者がなく、max_age秒以上イベントのないトピックを破棄し、破棄したトピックを返す"""
+        threshold = time.monotonic() - max_age
+        with self.lock:
+            expired = [topic for topic, updated in self.updated.items()
+                       if updated <= threshold and topic not in self.subscribers]
+            for topic in expired:
+                self.buffers.pop(topic, None)
+                self.counters.pop(topic, None)
+                del self.updated[topic]
+        return expired
+
+    def has_topic(self, topic):
+        with self.lock:
+            return topic in self.buffers
+
+    def _wake(self, sub):
+        # キューが満杯でも待機中のgetを起こせるよう、1件捨ててNoneを入れる
+        try:
+            sub.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            sub.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+def stream(bus, sub, heartbeat=15, retry=3000, end_event='done'):
+    """購読をSSEストリームとして返すジェネレーター
+
+    end_eventを受け取るか、受信が追いつかなくなったら終了する。
+    """
+    try:
+        yield f'retry: {retry}\n\n'
+        for ev in sub.backlog:
+            yield ev.to_sse()
+            if ev.event == end_event:
+                return
+        while True:
+            try:
+                ev = sub.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            if ev is None:
+                return
+            yield ev.to_sse()
+            if ev.event == end_event:
+                return
+    finally:
+        bus.unsubscribe(sub)
+
+
+def poll_stream(read, last_event_id=0, heartbeat=15, retry=3000, end_event='done', interval=0.5):
+    """readをポーリングしてSSEストリームとして返すジェネレーター（他プロセスのトピック用）
+
+    read(offset) は ([{'id', 'event', 'data'}, ...], 次のoffset) を返し、
+    トピックが消えた場合はイベントの代わりに None を返す。
+    """
+    yield f'retry: {retry}\n\n'
+    offset = 0
+    idle = 0
+    while True:
+        events, offset = read(offset)
+        if events is None:
+            return
+        for item in events:
+            if item['id'] > last_event_id:
+                yield Event(item['id'], item['event'], item['data']).to_sse()
+            if item['event'] == end_event:
+                return
+        if events:
+            idle = 0
+            continue
+        time.sleep(interval)
+        idle += interval
+        if idle >= heartbeat:
+            idle = 0
+            yield ': heartbeat\n\n'
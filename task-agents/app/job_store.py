@@ -0,0 +1,148 @@
+"""
+ジョブ状態のファイル共有
+複数ワーカープロセスで起動した場合でも、どのワーカーからでもジョブの状態・イベントを
+参照・キャンセルできるよう、JOBS_FOLDER にジョブごとのファイルとして保存する
+
+  <job_id>.json          最新のジョブ状態
+  <job_id>.events.jsonl  イベント（SSE再送用、追記のみ）
+  <job_id>.cancel        他ワーカーからのキャンセル要求
+  .slots/slot_<n>.lock   同時実行数の枠（実行中のジョブが flock で保持する）
+"""
+import os
+import json
+import time
+import uuid
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class JobStore:
+    """ファイルベースのジョブ状態ストア"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        # job_idはuuid4の16進文字列のみ受け付ける
+        try:
+            job_id = uuid.UUID(hex=job_id).hex
+        except (ValueError, TypeError):
+            return None
+        return os.path.join(self.folder, job_id + suffix)
+
+    def save(self, job_data):
+        """ジョブ状態をアトミックに書き込む"""
+        path = self._path(job_data['job_id'], '.json')
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job_data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id):
+        path = self._path(job_id, '.json')
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self):
+        jobs = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.json'):
+                job = self.load(entry.name[:-len('.json')])
+                if job is not None:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda job: job['created_at'])
+
+    def append_event(self, job_id, event_id, event, data):
+        """イベントを1行追記（O_APPENDのため1行単位で他プロセスと混ざらない）"""
+        line = json.dumps({'id': event_id, 'event': event, 'data': data}, ensure_ascii=False) + '\n'
+        with open(self._path(job_id, '.events.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def read_events(self, job_id, offset=0):
+        """offsetバイト目以降の完全な行のイベントを読み込み、(イベント, 次のoffset) を返す
+
+        ジョブが削除されている場合、イベントは None になる。
+        """
+        path = self._path(job_id, '.events.jsonl')
+        if path is None or not os.path.exists(path):
+            return None, offset
+        events = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                offset += len(raw)
+                events.append(json.loads(raw))
+        return events, offset
+
+    def request_cancel(self, job_id):
+        open(self._path(job_id, '.cancel'), 'w').close()
+
+    def cancel_requested(self, job_id):
+        path = self._path(job_id, '.cancel')
+        return path is not None and os.path.exists(path)
+
+    def remove(self, job_id):
+        for suffix in ('.json', '.events.jsonl', '.cancel'):
+            path = self._path(job_id, suffix)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def cleanup(self, retention):
+        """完了後retention秒以上経過したジョブを削除し、削除数を返す"""
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.tmp') and now - entry.stat().st_mtime >= 60:
+                os.remove(entry.path)
+            elif entry.name.endswith('.json') and now - entry.stat().st_mtime >= retention:
+                job = self.load(entry.name[:-len('.json')])
+                if job is not None and job.get('finished_at'):
+                    self.remove(job['job_id'])
+                    removed += 1
+        return removed
+
+
+class JobSlots:
+    """全ワーカープロセスで共有する同時実行数の枠
+
+    枠ごとのロックファイルを flock で取り合う。ロックはファイルを閉じるかプロセスが終了すると
+    OSが解放するため、ワーカーが異常終了しても枠が失われない。
+    """
+
+    def __init__(self, folder, count, poll_interval=1.0):
+        self.folder = os.path.join(folder, '.slots')
+        self.count = count
+        self.poll_interval = poll_interval
+        os.makedirs(self.folder, exist_ok=True)
+
+    def acquire(self, cancelled=None):
+        """空いた枠を取得するまで待ち、release に渡す値を返す
+
+        待機中に cancelled() が真になった場合は None を返す。
+        """
+        while True:
+            for n in range(self.count):
+                slot = open(os.path.join(self.folder, f'slot_{n}.lock'), 'w')
+                try:
+                    fcntl.flock(slot.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot
+                except OSError:
+                    slot.close()
+            if cancelled is not None and cancelled():
+                return None
+            time.sleep(self.poll_interval)
+
+    def release(self, slot):
+        slot.close()
@@ -0,0 +1,301 @@
+"""
+ジョブ管理
+エージェント実行やマスキングをサブプロセスとして実行し、ジョブIDごとに状態を管理する
+同時実行数は上限付きのワーカープールで制御し、超えた分はキューで待機させる
+slots を渡した場合は、実行前にその枠も取得する（複数プロセスで同時実行数を共有する）
+"""
+import os
+import time
+import uuid
+import signal
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# ジョブの状態
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, TIMEOUT)
+
+
+class JobError(Exception):
+    """ジョブ操作のエラー（HTTPステータスコード付き）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Job:
+    """1件のジョブの状態"""
+
+    def __init__(self, kind, argv, cwd=None, timeout=None, params=None,
+                 progress_parser=None, log_lines=200):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.argv = argv
+        self.cwd = cwd
+        self.timeout = timeout
+        self.params = params or {}
+        self.progress_parser = progress_parser
+        self.counters = {}
+        self.state = QUEUED
+        self.progress = 0
+        self.message = 'キューで待機中'
+        self.log = deque(maxlen=log_lines)
+        self.returncode = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.process = None
+        self.future = None
+
+    @property
+    def running(self):
+        return self.state == RUNNING
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def to_dict(self, include_log=True):
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'running': self.running,
+            'progress': self.progress,
+            'message': self.message,
+            'params': self.params,
+            'returncode': self.returncode,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if include_log:
+            data['log'] = list(self.log)
+        return data
+
+
+class JobManager:
+    """上限付きワーカープールでジョブを実行・管理する"""
+
+    def __init__(self, max_workers=2, max_queue=20, timeout=None, log_lines=200, listener=None,
+                 cancel_check=None, cancel_poll_interval=1.0, slots=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.log_lines = log_lines
+        self.listener = listener
+        self.slots = slots
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+        # 外部（他ワーカープロセス）からのキャンセル要求を定期的に確認
+        self.cancel_check = cancel_check
+        self.cancel_poll_interval = cancel_poll_interval
+        if cancel_check is not None:
+            threading.Thread(target=self._watch_cancel, name='job-cancel-watch', daemon=True).start()
+
+    def submit(self, kind, argv, cwd=None, timeout=None, params=None, progress_parser=None):
+        """ジョブを登録してキューに投入"""
+        job = Job(kind, argv, cwd=cwd, timeout=timeout or self.timeout, params=params,
+                  progress_parser=progress_parser, log_lines=self.log_lines)
+        with self.lock:
+            queued = sum(1 for j in self.jobs.values() if j.state == QUEUED)
+            if self.max_queue and queued >= self.max_queue:
+                raise JobError('実行待ちのジョブが多すぎます。しばらくしてから再実行してください', 503)
+            self.jobs[job.id] = job
+            self._emit(job, 'state', job.to_dict(include_log=False))
+            job.future = self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(f'ジョブが見つかりません: {job_id}', 404)
+        return job
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """ジョブをキャンセル（実行中ならプロセスを終了）"""
+        job = self.get(job_id)
+        with self.lock:
+            if job.finished:
+                return job
+            job.cancel_requested = True
+            if job.state == QUEUED and job.future.cancel():
+                self._finish(job, CANCELLED, 'キャンセルされました')
+                return job
+            process = job.process
+        if process is not None:
+            self._terminate(process)
+        return job
+
+    def remove(self, job_id):
+        """完了したジョブの記録を削除"""
+        job = self.get(job_id)
+        with self.lock:
+            if not job.finished:
+                raise JobError('実行中のジョブは削除できません', 409)
+            del self.jobs[job_id]
+
+    def prune(self, retention):
+        """完了から retention 秒以上経ったジョブの記録を削除し、削除したジョブIDを返す"""
+        now = datetime.now()
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_at
+                       and (now - datetime.fromisoformat(job.finished_at)).total_seconds() >= retention]
+            for job_id in expired:
+                del self.jobs[job_id]
+        return expired
+
+    def shutdown(self, wait=0):
+        """ジョブをすべて終了
+
+        待機中のジョブはキャンセルし、実行中のジョブは最大 wait 秒完了を待ってから終了する。
+        """
+        for job in self.list():
+            if job.state == QUEUED:
+                self.cancel(job.id)
+        deadline = time.monotonic() + wait
+        for job in self.list():
+            if not job.finished and job.future is not None:
+                try:
+                    job.future.result(timeout=max(0, deadline - time.monotonic()))
+                except Exception:
+                    pass
+        for job in self.list():
+            if not job.finished:
+                self.cancel(job.id)
+        self.executor.shutdown(wait=False)
+
+    def _terminate(self, process):
+        """プロセスグループごと終了（子プロセスが残らないようにする）"""
+        def send(sig, fallback):
+            try:
+                if os.name == 'posix':
+                    os.killpg(process.pid, sig)
+                else:
+                    fallback()
+            except ProcessLookupError:
+                pass
+
+        send(signal.SIGTERM, process.terminate)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            send(getattr(signal, 'SIGKILL', signal.SIGTERM), process.kill)
+
+    def _watch_cancel(self):
+        while True:
+            time.sleep(self.cancel_poll_interval)
+            for job in self.list():
+                if not job.finished and not job.cancel_requested:
+                    try:
+                        if self.cancel_check(job.id):
+                            self.cancel(job.id)
+                    except Exception:
+                        pass
+
+    def _emit(self, job, event, data):
+        """状態変化をlistenerへ通知（state / log / done）"""
+        if self.listener is not None:
+            self.listener(job, event, data)
+
+    def _finish(self, job, state, message, error=None):
+        job.state = state
+        job.message = message
+        job.error = error
+        job.finished_at = datetime.now().isoformat()
+        if state == SUCCEEDED:
+            job.progress = 100
+        self._emit(job, 'done', job.to_dict(include_log=False))
+
+    def _on_line(self, job, line):
+        job.log.append(line)
+        if job.progress_parser:
+            progress = job.progress_parser(line, job)
+            if progress is not None:
+                job.progress = max(0, min(99, int(progress)))
+        job.message = line
+        self._emit(job, 'log', {'line': line, 'progress': job.progress})
+
+    def _run(self, job):
+        slot = None
+        if self.slots is not None:
+            # 他のプロセスの実行中ジョブで枠が埋まっている間はキューで待機する
+            slot = self.slots.acquire(lambda: job.cancel_requested)
+        try:
+            self._execute(job)
+        finally:
+            if slot is not None:
+                self.slots.release(slot)
+
+    def _execute(self, job):
+        timed_out = threading.Event()
+
+        with self.lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED, 'キャンセルされました')
+                return
+            try:
+                job.process = subprocess.Popen(
+                    job.argv, cwd=job.cwd,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    stdin=subprocess.DEVNULL, text=True, encoding='utf-8', errors='replace',
+                    env=dict(os.environ, PYTHONUNBUFFERED='1'),
+                    start_new_session=(os.name == 'posix'))
+            except OSError as e:
+                self._finish(job, FAILED, 'ジョブを開始できませんでした', str(e))
+                return
+            job.state = RUNNING
+            job.started_at = datetime.now().isoformat()
+            job.message = '実行中'
+            self._emit(job, 'state', job.to_dict(include_log=False))
+
+        def on_timeout():
+            timed_out.set()
+            self._terminate(job.process)
+
+        timer = None
+        if job.timeout:
+            timer = threading.Timer(job.timeout, on_timeout)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            for line in job.process.stdout:
+                self._on_line(job, line.rstrip('\n'))
+            job.returncode = job.process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        with self.lock:
+            if timed_out.is_set():
+                self._finish(job, TIMEOUT, f'タイムアウトしました（{job.timeout}秒）', 'timeout')
+            elif job.cancel_requested:
+                self._finish(job, CANCELLED, 'キャンセルされました')
+            elif job.returncode == 0:
+                self._finish(job, SUCCEEDED, '完了しました')
+            else:
+                self._finish(job, FAILED, f'終了コード {job.returncode} で失敗しました',
+                             job.log[-1] if job.log else None)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+AI1O Agent Web App 負荷試験スクリプト
+一時フォルダに合成エージェントを作ってローカルにサーバーを起動し、
+同時接続数を段階的に上げながら各APIのスループット・レイテンシ・エラー率・サーバーRSSを測定する
+
+使い方:
+  python loadtest.py                                  serve.py（gunicorn）を起動して測定
+  python loadtest.py --concurrency 1,8,32 --duration 10 --payload-size 1048576
+  python loadtest.py --server dev                     app.py（開発サーバー）を起動して測定
+  python loadtest.py --url http://127.0.0.1:5001 --server-pid 1234   起動済みのサーバーを測定
+  python loadtest.py --compare loadtest_results/20250801_120000.json  前回の結果と比較
+
+結果は --output（既定: loadtest_results/<日時>.json）に保存される。
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = ['index', 'agents', 'prepare', 'upload', 'upload_result']
+
+
+def percentile(sorted_values, p):
+    """最近接順位法によるパーセンタイル"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def create_agents(agents_dir, count):
+    """合成エージェント（単体ファイルとフォルダを半分ずつ）を作成"""
+    body = '\n'.join(f'- 手順{i}: 入力ファイルを確認し、結果をまとめる' for i in range(200))
+    for i in range(count):
+        description = f'description: 負荷試験用のエージェント{i}です'
+        if i % 2:
+            folder = os.path.join(agents_dir, f'bench-folder-{i:03d}')
+            os.makedirs(folder, exist_ok=True)
+            for step in range(3):
+                with open(os.path.join(folder, f'{step:02d}_step.md'), 'w', encoding='utf-8') as f:
+                    f.write(f'---\n{description}\n---\n# ステップ{step}\n{body}\n')
+        else:
+            with open(os.path.join(agents_dir, f'bench-agent-{i:03d}.md'), 'w', encoding='utf-8') as f:
+                f.write(f'---\n{description}\n---\n# エージェント{i}\n{body}\n')
+    return 'bench-agent-000'
+
+
+def multipart(field, filename, data, content_type='text/plain'):
+    """multipart/form-dataのボディとContent-Typeを作成"""
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    return head + data + tail, f'multipart/form-data; boundary={boundary}'
+
+
+class Payloads:
+    """リクエストごとのボディを作成（内容の重複排除が効かないよう先頭に連番を入れる）"""
+
+    def __init__(self, size, agent_name, unique=True):
+        line = 'これは負荷試験用の合成データです。The quick brown fox jumps over the lazy dog.\n'.encode()
+        self.filler = (line * (size // len(line) + 1))[:size]
+        self.agent_name = agent_name
+        self.unique = unique
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def _data(self):
+        if not self.unique:
+            return self.filler
+        with self.lock:
+            self.counter += 1
+            n = self.counter
+        prefix = f'{n:012d}\n'.encode()
+        return prefix + self.filler[len(prefix):]
+
+    def request(self, endpoint):
+        """(メソッド, パス, ボディ, ヘッダー) を返す"""
+        if endpoint == 'index':
+            return 'GET', '/', None, {}
+        if endpoint == 'agents':
+            return 'GET', '/api/agents', None, {}
+        if endpoint == 'prepare':
+            body = json.dumps({'agent': self.agent_name, 'prompt': '負荷試験の入力を要約してください',
+                               'input_files': ['bench.txt']}).encode()
+            return 'POST', '/api/prepare', body, {'Content-Type': 'application/json'}
+        if endpoint == 'upload':
+            body, content_type = multipart('files', 'bench.txt', self._data())
+            return 'POST', '/api/upload', body, {'Content-Type': content_type}
+        if endpoint == 'upload_result':
+            body, content_type = multipart('result_files', 'result.md', self._data(), 'text/markdown')
+            return 'POST', '/api/upload_result', body, {'Content-Type': content_type}
+        raise ValueError(f'unknown endpoint: {endpoint}')
+
+
+def process_tree_rss(pid):
+    """プロセスとその子孫のRSS合計（バイト）。/procが無い環境ではNone"""
+    if pid is None or not os.path.isdir('/proc'):
+        return None
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # commに空白や括弧が含まれても良いよう、最後の ')' 以降を分割する
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        stack.extend(children.get(current, ()))
+    return total
+
+
+class RssSampler:
+    """測定中のサーバーRSSを定期的に記録し、最大値を返す"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            rss = process_tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+
+def run_level(base_url, endpoint, concurrency, duration, payloads, timeout):
+    """1つのエンドポイントを指定の同時接続数でduration秒間叩き、結果を返す"""
+    url = urlsplit(base_url)
+    latencies = []
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        conn = None
+        local_latencies = []
+        local_errors = {}
+        while time.perf_counter() < deadline:
+            method, path, body, headers = payloads.request(endpoint)
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+                if conn is not None:
+                    conn.close()
+                conn = None
+            elapsed = time.perf_counter() - started
+            if isinstance(status, int) and status < 400:
+                local_latencies.append(elapsed)
+            else:
+                local_errors[str(status)] = local_errors.get(str(status), 0) + 1
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for key, count in local_errors.items():
+                errors[key] = errors.get(key, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    error_count = sum(errors.values())
+    total = len(latencies) + error_count
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': total,
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'errors': errors,
+        'error_rate': round(error_count / total, 4) if total else 0,
+    }
+
+
+def wait_for_server(base_url, process, timeout=60):
+    url = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'サーバーが起動直後に終了しました（終了コード {process.returncode}）')
+        try:
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=2)
+            conn.request('GET', '/api/agents')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+            conn.close()
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('サーバーの起動を確認できませんでした')
+
+
+def start_server(args, workdir, port):
+    """合成データ用の設定でサーバーを起動"""
+    env = dict(os.environ)
+    env.update({
+        'HOST': '127.0.0.1',
+        'PORT': str(port),
+        'DEBUG': 'false',
+        'AGENTS_FOLDER': os.path.join(workdir, 'agents'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'OUTPUT_FOLDER': os.path.join(workdir, 'output'),
+        'JOBS_FOLDER': os.path.join(workdir, 'jobs'),
+        'SEARCH_ROOTS': os.path.join(workdir, 'output'),
+        'SEARCH_INDEX_PATH': os.path.join(workdir, 'search', 'index.sqlite3'),
+        'MAX_UPLOAD_SIZE': str(max(args.payload_size * 2, 16 * 1024 * 1024)),
+    })
+    if args.server == 'serve':
+        command = [sys.executable, 'serve.py', '--workers', str(args.workers), '--threads', str(args.threads)]
+    else:
+        command = [sys.executable, 'app.py']
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    process = subprocess.Popen(command, cwd=script_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return process
+
+
+def stop_server(process):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=script_dir,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_row(result):
+    rss = f"{result['rss_mb']:.1f}" if result.get('rss_mb') is not None else '-'
+    p50, p95, p99 = (f"{result[key]:.1f}" if result[key] is not None else '-'
+                     for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+    return (f"{result['endpoint']:<14}{result['concurrency']:>5}{result['requests']:>9}"
+            f"{result['throughput']:>10.1f}{p50:>9}{p95:>9}{p99:>9}"
+            f"{result['error_rate'] * 100:>8.2f}%{rss:>9}")
+
+
+def print_header():
+    print(f"{'endpoint':<14}{'conc':>5}{'reqs':>9}{'req/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+          f"{'errors':>9}{'rssMB':>9}")
+
+
+def compare(previous_path, results):
+    """前回の結果と同じ (endpoint, concurrency) のスループット・p95を比較して表示"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    before = {(r['endpoint'], r['concurrency']): r for r in previous['results']}
+    print(f"\n📊 Compared with {previous_path} (revision {previous.get('revision') or '?'})")
+    print(f"{'endpoint':<14}{'conc':>5}{'req/s':>18}{'p95ms':>20}")
+    for result in results:
+        old = before.get((result['endpoint'], result['concurrency']))
+        if old is None:
+            continue
+
+        def change(new, prev):
+            if new is None or prev is None or not prev:
+                return '-'
+            return f"{prev:.1f}→{new:.1f} ({(new - prev) / prev * 100:+.0f}%)"
+
+        print(f"{result['endpoint']:<14}{result['concurrency']:>5}"
+              f"{change(result['throughput'], old['throughput']):>18}"
+              f"{change(result['p95_ms'], old['p95_ms']):>20}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='AI1O Agent Web App の負荷試験')
+    parser.add_argument('--url', help='起動済みサーバーのURL（省略時は一時フォルダでサーバーを起動）')
+    parser.add_argument('--server-pid', type=int, help='--url 指定時にRSSを測定するサーバーのPID')
+    parser.add_argument('--server', choices=['serve', 'dev'], default='serve',
+                        help='起動するサーバー（serve: serve.py / dev: app.py）')
+    parser.add_argument('--workers', type=int, default=4, help='serve.py のワーカープロセス数')
+    parser.add_argument('--threads', type=int, default=8, help='serve.py のワーカーごとのスレッド数')
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                        help=f'測定するエンドポイント（カンマ区切り: {",".join(ENDPOINTS)}）')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='同時接続数の段階（カンマ区切り）')
+    parser.add_argument('--duration', type=float, default=5, help='1段階あたりの測定秒数')
+    parser.add_argument('--payload-size', type=int, default=64 * 1024, help='アップロード1件のバイト数')
+    parser.add_argument('--same-payload', action='store_true',
+                        help='毎回同じ内容をアップロード（重複排除が効く場合の測定）')
+    parser.add_argument('--agents', type=int, default=50, help='合成エージェント数')
+    parser.add_argument('--timeout', type=float, default=30, help='リクエストのタイムアウト秒数')
+    parser.add_argument('--output', help='結果の保存先（既定: loadtest_results/<日時>.json）')
+    parser.add_argument('--compare', help='比較する過去の結果ファイル')
+    parser.add_argument('--keep', action='store_true', help='一時フォルダとサーバーログを削除しない')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    endpoints = [e.strip() for e in args.endpoints.split(',') if e.strip()]
+    unknown = [e for e in endpoints if e not in ENDPOINTS]
+    if unknown:
+        print(f"❌ Unknown endpoints: {', '.join(unknown)}")
+        sys.exit(2)
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+
+    workdir = tempfile.mkdtemp(prefix='ai1o-loadtest-')
+    agents_dir = os.path.join(workdir, 'agents')
+    os.makedirs(agents_dir)
+    agent_name = create_agents(agents_dir, args.agents)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        server_pid = args.server_pid
+    else:
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        process = start_server(args, workdir, port)
+        server_pid = process.pid
+
+    print("🚦 AI1O Agent Web App load test")
+    print(f"📍 Target: {base_url}  workdir: {workdir}")
+    results = []
+    try:
+        wait_for_server(base_url, process)
+        payloads = Payloads(args.payload_size, agent_name, unique=not args.same_payload)
+        print(f"📦 Payload: {args.payload_size} bytes, agents: {args.agents}, duration: {args.duration}s/level\n")
+        print_header()
+        for endpoint in endpoints:
+            for concurrency in levels:
+                with RssSampler(server_pid) as sampler:
+                    result = run_level(base_url, endpoint, concurrency, args.duration, payloads, args.timeout)
+                result['rss_mb'] = round(sampler.peak / 1024 / 1024, 1) if sampler.peak else None
+                results.append(result)
+                print(format_row(result), flush=True)
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted, saving partial results")
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        args.keep = True
+    finally:
+        stop_server(process)
+        if args.keep:
+            print(f"📝 Server log: {os.path.join(workdir, 'server.log')}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if not results:
+        sys.exit(1)
+
+    output = args.output or os.path.join(script_dir, 'loadtest_results',
+                                         datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'revision': git_revision(),
+            'created_at': datetime.now().isoformat(),
+            'target': args.url or args.server,
+            'settings': {
+                'workers': args.workers if not args.url and args.server == 'serve' else None,
+                'threads': args.threads if not args.url and args.server == 'serve' else None,
+                'duration': args.duration,
+                'payload_size': args.payload_size,
+                'same_payload': args.same_payload,
+                'agents': args.agents,
+            },
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Results saved: {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
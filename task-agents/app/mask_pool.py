@@ -0,0 +1,207 @@
+"""
+アップロードファイルのマスキング用ワーカープール
+TextMasker（GiNZAモデル）をロード済みのプロセス（mask_worker.py）を常駐させ、
+アップロードされたファイルをバックグラウンドでマスキングする
+"""
+import os
+import sys
+import time
+import json
+import queue
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from jobs import Job, RUNNING, SUCCEEDED, FAILED
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mask_worker.py')
+
+
+class MaskWorker:
+    """mask_worker.py のプロセス1つ（JSON行で1ファイルずつ依頼する）"""
+
+    def __init__(self, python, mask_script):
+        self.process = subprocess.Popen(
+            [python, WORKER_SCRIPT, mask_script],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding='utf-8', bufsize=1)
+        # モデルのロード完了を待つ
+        self.pid = self._receive().get('pid')
+
+    def _receive(self):
+        line = self.process.stdout.readline()
+        if not line:
+            returncode = self.process.wait()
+            raise RuntimeError(f'マスキングワーカーが終了しました（終了コード {returncode}）')
+        return json.loads(line)
+
+    def mask(self, input_path, output_path):
+        """1ファイルをマスキングし、(成功フラグ, 処理秒数, バイト数) を返す"""
+        try:
+            self.process.stdin.write(json.dumps({'input': input_path, 'output': output_path},
+                                                ensure_ascii=False) + '\n')
+            self.process.stdin.flush()
+        except OSError:
+            raise RuntimeError(f'マスキングワーカーが終了しました（終了コード {self.process.wait()}）')
+        reply = self._receive()
+        if reply.get('error'):
+            raise RuntimeError(reply['error'])
+        return reply['ok'], reply['seconds'], reply['size']
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class MaskPool:
+    """常駐TextMaskerワーカーでアップロードファイルをマスキングする
+
+    ワーカーは MASK_PYTHON のサブプロセスとして起動するため、アプリのモジュールは読み込まれない。
+    """
+
+    def __init__(self, upload_folder, mask_script, workers=1, listener=None, python=None):
+        """
+        Args:
+            python: ワーカーを起動するPythonインタープリター（GiNZAを入れた別環境など。省略時は sys.executable）
+        """
+        self.upload_folder = upload_folder
+        self.mask_script = mask_script
+        self.python = python or sys.executable
+        self.workers = workers
+        self.listener = listener
+        self.lock = threading.Lock()
+        self.executor = None
+        # 依頼を待っているワーカープロセス（同時に使うのは executor のスレッド数まで）
+        self.idle = queue.Queue()
+        self.processes = set()
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='mask')
+            return self.executor
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        worker = MaskWorker(self.python, self.mask_script)
+        with self.lock:
+            self.processes.add(worker)
+        return worker
+
+    def _discard(self, worker):
+        with self.lock:
+            self.processes.discard(worker)
+        worker.stop()
+
+    def _mask_file(self, input_path, output_path):
+        worker = self._acquire()
+        try:
+            result = worker.mask(input_path, output_path)
+        except Exception:
+            # 異常終了したワーカーは捨て、次回の依頼時に起動し直す
+            if worker.process.poll() is not None:
+                self._discard(worker)
+            else:
+                self.idle.put(worker)
+            raise
+        self.idle.put(worker)
+        return result
+
+    def _warm(self):
+        worker = self._acquire()
+        self.idle.put(worker)
+        return worker.pid
+
+    def warm(self):
+        """全ワーカーを起動してモデルをロードしておく"""
+        executor = self._get_executor()
+        return [executor.submit(self._warm) for _ in range(self.workers)]
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+            processes, self.processes = self.processes, set()
+        for worker in processes:
+            worker.stop()
+        self.idle = queue.Queue()
+
+    def _masked_dir(self):
+        path = os.path.join(self.upload_folder, '.masked')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cached(self, digest):
+        """同じ内容のマスキング済みファイルがあればファイル名を返す"""
+        try:
+            with open(os.path.join(self._masked_dir(), digest + '.json'), 'r', encoding='utf-8') as f:
+                filename = json.load(f)['masked_file']
+        except (OSError, ValueError, KeyError):
+            return None
+        if os.path.exists(os.path.join(self.upload_folder, filename)):
+            return filename
+        return None
+
+    def submit(self, filename, digest):
+        """アップロード済みファイルのマスキングを投入し、ジョブを返す"""
+        from upload_store import store_file
+
+        job = Job('upload_mask', None, params={'file': filename, 'sha256': digest})
+        input_path = os.path.join(self.upload_folder, filename)
+        stem, ext = os.path.splitext(filename)
+        tmp_path = os.path.join(self._masked_dir(), f'{job.id}{ext}')
+        submitted = time.perf_counter()
+
+        def on_done(future):
+            total = time.perf_counter() - submitted
+            try:
+                ok, elapsed, size = future.result()
+                if not ok:
+                    raise RuntimeError(f'マスキングに失敗しました: {filename}')
+                masked_file = store_file(self.upload_folder, tmp_path, f'{stem}.masked{ext}')
+                with open(os.path.join(self._masked_dir(), digest + '.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'file': filename, 'masked_file': masked_file}, f, ensure_ascii=False)
+                job.result = {
+                    'masked_file': masked_file,
+                    'mask_seconds': round(elapsed, 4),
+                    'queue_seconds': round(max(total - elapsed, 0), 4),
+                    'total_seconds': round(total, 4),
+                    'bytes_per_second': round(size / elapsed) if elapsed else None
+                }
+                self._finish(job, SUCCEEDED, f'マスキング完了（{elapsed:.2f}秒）')
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                self._finish(job, FAILED, 'マスキングに失敗しました', str(e) or type(e).__name__)
+
+        job.state = RUNNING
+        job.started_at = datetime.now().isoformat()
+        job.message = 'マスキング中'
+        self._emit(job, 'state', job.to_dict(include_log=False))
+        try:
+            future = self._get_executor().submit(self._mask_file, input_path, tmp_path)
+        except Exception as e:
+            self.shutdown()
+            self._finish(job, FAILED, 'マスキングワーカーを起動できませんでした', str(e))
+            return job
+        future.add_done_callback(on_done)
+        return job
+
+    def _emit(self, job, event, data):
+        if self.listener is not None:
+            self.listener(job, event, data)
+
+    def _finish(self, job, state, message, error=None):
+        job.state = state
+        job.message = message
+        job.error = error
+        job.finished_at = datetime.now().isoformat()
+        if state == SUCCEEDED:
+            job.progress = 100
+        self._emit(job, 'done', job.to_dict(include_log=False))
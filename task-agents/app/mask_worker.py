@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+アップロードファイルのマスキング用常駐ワーカー
+mask_pool.py から MASK_PYTHON（未設定ならアプリと同じPython）のサブプロセスとして起動される
+
+アプリのモジュールは読み込まず、起動したPython自身の sys.path で mask_text.py を読み込むため、
+GiNZAをアプリとは別の仮想環境に入れても使える。
+
+使い方:
+  python mask_worker.py <mask_text.pyのパス>
+
+標準入力から1行1件のJSON {"input": <入力パス>, "output": <出力パス>} を受け取り、
+標準出力へ1行1件のJSON {"ok", "seconds", "size", "error"} を返す。
+起動時はモデルのロード後に {"ready": true, "pid": <PID>} を1行返す。
+mask_text.py の表示はプロトコルと混ざらないよう標準エラーへ出す。
+"""
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('usage: mask_worker.py <mask_text.py>', file=sys.stderr)
+        return 2
+
+    # 応答用に元の標準出力を残し、以降の print は標準エラーへ向ける
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def reply(data):
+        out.write(json.dumps(data, ensure_ascii=False) + '\n')
+        out.flush()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+    import mask_text
+    mask_text.init_worker()
+    reply({'ready': True, 'pid': os.getpid()})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        started = time.perf_counter()
+        try:
+            ok, _ = mask_text.process_file(mask_text._masker, Path(request['input']), Path(request['output']),
+                                           keep_filename=True)
+            error = None
+        except Exception as e:
+            ok, error = False, f'{type(e).__name__}: {e}'
+        elapsed = time.perf_counter() - started
+        reply({
+            'ok': bool(ok),
+            'seconds': elapsed,
+            'size': os.path.getsize(request['input']) if ok else 0,
+            'error': error
+        })
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
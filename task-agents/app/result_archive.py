@@ -0,0 +1,225 @@
+"""
+実行結果ファイルの取り込み
+個別ファイルに加えて zip / tar（gzip等の圧縮も可）のアーカイブを1つの結果フォルダへ展開し、
+ファイルごとのサイズとSHA-256のマニフェストを返す
+"""
+import os
+import uuid
+import tarfile
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from chunked_upload import UploadError, copy_stream
+from upload_store import HashingWriter
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ARCHIVE_CONTENT_TYPES = {
+    'application/zip': 'zip',
+    'application/x-zip-compressed': 'zip',
+    'application/x-tar': 'tar',
+    'application/gzip': 'tar',
+    'application/x-gzip': 'tar',
+    'application/x-bzip2': 'tar',
+    'application/x-xz': 'tar'
+}
+
+# tarの小さいメンバーはメモリに読み込んで並列に書き込む（それ以上は順番に書き込む）
+SMALL_MEMBER_SIZE = 1024 * 1024
+# 並列書き込み待ちでメモリに保持する最大バイト数
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+
+
+def archive_type(filename=None, content_type=None):
+    """アーカイブの種類（'zip' / 'tar'）を判定（アーカイブでなければNone）"""
+    if filename:
+        name = filename.lower()
+        if name.endswith('.zip'):
+            return 'zip'
+        if name.endswith(ARCHIVE_SUFFIXES):
+            return 'tar'
+    if content_type:
+        return ARCHIVE_CONTENT_TYPES.get(content_type.split(';')[0].strip().lower())
+    return None
+
+
+def create_result_dir(output_folder):
+    """一意な名前の結果フォルダを作成"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    result_dir = os.path.join(output_folder, f'claude_code_result_{timestamp}_{uuid.uuid4().hex[:8]}')
+    os.makedirs(result_dir)
+    return result_dir
+
+
+def safe_member_path(name):
+    """アーカイブ内のパスを結果フォルダ内の相対パスに正規化（不正なパスはNone）"""
+    parts = []
+    for part in name.replace('\\', '/').split('/'):
+        if part in ('', '.'):
+            continue
+        if part == '..' or '\x00' in part:
+            return None
+        parts.append(part)
+    # macOSのメタデータは取り込まない
+    if not parts or parts[0] == '__MACOSX' or parts[-1] == '.DS_Store':
+        return None
+    return os.path.join(*parts)
+
+
+class _AccountedWriter:
+    """書き込むバイト数を先に account に渡してから書き込む"""
+
+    def __init__(self, fp, account):
+        self.fp = fp
+        self.account = account
+
+    def write(self, data):
+        self.account(len(data))
+        return self.fp.write(data)
+
+
+class ResultWriter:
+    """結果フォルダへのファイル書き込み（合計サイズ・ファイル数の上限付き）"""
+
+    def __init__(self, result_dir, max_size, max_files):
+        self.result_dir = result_dir
+        self.max_size = max_size
+        self.max_files = max_files
+        self.total = 0
+        self.manifest = []
+        self.names = set()
+        self.lock = threading.Lock()
+
+    def _reserve(self, relpath):
+        with self.lock:
+            if self.max_files and len(self.manifest) >= self.max_files:
+                raise UploadError(f'ファイル数が上限（{self.max_files}）を超えています', 413)
+            filename = relpath.replace(os.sep, '/')
+            if filename in self.names:
+                raise UploadError(f'同じ名前のファイルが複数あります: {filename}', 409)
+            self.names.add(filename)
+            entry = {'filename': filename}
+            self.manifest.append(entry)
+            return entry
+
+    def _account(self, size):
+        with self.lock:
+            self.total += size
+            if self.max_size and self.total > self.max_size:
+                raise UploadError(f'展開後のサイズが上限（{self.max_size}バイト）を超えています', 413)
+
+    def write(self, relpath, stream):
+        """ストリームをファイルに書き込み、マニフェストに追加
+
+        並列に書き込んでも合計サイズの上限を超えないよう、書き込む前にバッファごとにサイズを確保する。
+        """
+        entry = self._reserve(relpath)
+        path = os.path.join(self.result_dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            writer = HashingWriter(fp)
+            size = copy_stream(stream, _AccountedWriter(writer, self._account), self.max_size or float('inf'))
+        entry.update({'path': path, 'size': size, 'sha256': writer.hexdigest()})
+        return entry
+
+    def write_bytes(self, relpath, data):
+        """メモリ上のデータをファイルに書き込み、マニフェストに追加"""
+        entry = self._reserve(relpath)
+        self._account(len(data))
+        path = os.path.join(self.result_dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            writer = HashingWriter(fp)
+            writer.write(data)
+        entry.update({'path': path, 'size': len(data), 'sha256': writer.hexdigest()})
+        return entry
+
+    def sorted_manifest(self):
+        return sorted(self.manifest, key=lambda entry: entry['filename'])
+
+
+def extract_tar(fileobj, writer, workers=4):
+    """tarをストリームとして順に読み、小さいファイルは並列に書き込む"""
+    pending = threading.BoundedSemaphore(max(MAX_PENDING_BYTES // SMALL_MEMBER_SIZE, 1))
+    futures = []
+
+    def write_small(relpath, data):
+        try:
+            writer.write_bytes(relpath, data)
+        finally:
+            pending.release()
+
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode='r|*')
+    except tarfile.TarError as e:
+        raise UploadError(f'アーカイブを読み込めません: {e}')
+
+    with archive, ThreadPoolExecutor(max_workers=workers, thread_name_prefix='result-write') as executor:
+        try:
+            for member in archive:
+                # 通常ファイル以外（リンク・デバイス等）は取り込まない
+                if not member.isfile():
+                    continue
+                relpath = safe_member_path(member.name)
+                if relpath is None:
+                    continue
+                source = archive.extractfile(member)
+                if member.size <= SMALL_MEMBER_SIZE:
+                    data = source.read()
+                    pending.acquire()
+                    futures.append(executor.submit(write_small, relpath, data))
+                else:
+                    writer.write(relpath, source)
+        except tarfile.TarError as e:
+            raise UploadError(f'アーカイブを読み込めません: {e}')
+        finally:
+            for future in futures:
+                future.result()
+
+
+def extract_zip(path, writer, workers=4):
+    """zipのメンバーを並列に展開（スレッドごとにファイルを開く）"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+    except zipfile.BadZipFile as e:
+        raise UploadError(f'アーカイブを読み込めません: {e}')
+
+    local = threading.local()
+    handles = []
+
+    def extract(info):
+        if not hasattr(local, 'archive'):
+            local.archive = zipfile.ZipFile(path)
+            handles.append(local.archive)
+        relpath = safe_member_path(info.filename)
+        if relpath is None:
+            return
+        with local.archive.open(info) as source:
+            writer.write(relpath, source)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='result-write') as executor:
+            for future in [executor.submit(extract, info) for info in members]:
+                future.result()
+    except zipfile.BadZipFile as e:
+        raise UploadError(f'アーカイブを読み込めません: {e}')
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def extract_archive(kind, stream, writer, workers=4):
+    """アーカイブを展開（zipはランダムアクセスが必要なため一時ファイルに保存してから展開）"""
+    if kind == 'tar':
+        extract_tar(stream, writer, workers)
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix='.zip')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            copy_stream(stream, fp, writer.max_size or float('inf'))
+        extract_zip(tmp_path, writer, workers)
+    finally:
+        os.remove(tmp_path)
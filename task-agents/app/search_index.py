@@ -0,0 +1,281 @@
+"""
+エージェント出力の全文検索インデックス
+日本語は文字bigram、英数字は単語単位でトークン化した転置インデックスをSQLiteに保存する
+（GiNZAなどの形態素解析は使わない）
+ファイルのmtime・サイズで変更を検出し、変更のあったファイルだけを再インデックスする
+検索はBM25でランキングしてから、上位の文書だけ本文に語が含まれるかを確認する
+"""
+import os
+import re
+import math
+import html
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+
+INDEX_EXTENSIONS = ('.md', '.txt')
+SNIPPET_WIDTH = 120
+# 本文の確認を一度に行う最大文書数（SQLiteの変数の数の上限より小さくする）
+VERIFY_BATCH = 200
+# スキーマを変更したら上げる（古いインデックスは作り直す）
+SCHEMA_VERSION = 2
+
+# 英数字の連続、またはそれ以外の文字（かな・漢字など）の連続
+_RUN_RE = re.compile(r'[0-9a-z_]+|[^\W0-9a-z_]+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    normalized TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (token, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+
+def normalize(text):
+    """全角・半角と大文字・小文字を揃える"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def tokenize(text):
+    """テキストをトークンに分割（英数字は単語、それ以外は文字bigram）"""
+    tokens = []
+    for run in _RUN_RE.findall(normalize(text)):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def extract_title(content, path):
+    """最初の見出し、なければファイル名をタイトルにする"""
+    for line in content.split('\n'):
+        if line.startswith('#'):
+            title = line.lstrip('#').strip()
+            if title:
+                return title
+    return os.path.basename(path)
+
+
+def make_snippet(content, terms, width=SNIPPET_WIDTH):
+    """最初に一致した箇所の前後を切り出し、一致部分を<mark>で囲んだHTMLを返す"""
+    lowered = content.lower()
+    positions = [lowered.find(term) for term in terms if term]
+    positions = [p for p in positions if p >= 0]
+    start = max(min(positions) - width // 3, 0) if positions else 0
+    text = content[start:start + width].replace('\n', ' ')
+
+    pattern = '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True) if term)
+    parts = re.split(f'({pattern})', text, flags=re.IGNORECASE) if pattern else [text]
+    snippet = ''.join(f'<mark>{html.escape(p)}</mark>' if i % 2 else html.escape(p)
+                      for i, p in enumerate(parts))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + width < len(content) else ''
+    return prefix + snippet + suffix
+
+
+class SearchIndex:
+    """SQLiteに保存する転置インデックス"""
+
+    def __init__(self, index_path, roots, refresh_interval=30):
+        self.index_path = index_path
+        self.roots = roots
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = 0
+        self.refresh_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._migrate()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _migrate(self):
+        """スキーマが古ければテーブルを作り直す（内容は次のrefreshで再インデックスされる）"""
+        conn = self._connect()
+        try:
+            # 複数ワーカーが同時に起動しても作り直しは1回だけ行う
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS postings')
+                conn.execute('DROP TABLE IF EXISTS docs')
+                for statement in _SCHEMA.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _index_doc(self, conn, path, st):
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+        except OSError:
+            return False
+        tokens = Counter(tokenize(content))
+        conn.execute('DELETE FROM postings WHERE doc_id IN (SELECT id FROM docs WHERE path = ?)', (path,))
+        conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+        cur = conn.execute(
+            'INSERT INTO docs (path, mtime, size, title, length, content, normalized) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, st.st_mtime, st.st_size, extract_title(content, path), sum(tokens.values()), content,
+             normalize(content)))
+        conn.executemany('INSERT INTO postings (token, doc_id, tf) VALUES (?, ?, ?)',
+                         [(token, cur.lastrowid, tf) for token, tf in tokens.items()])
+        return True
+
+    def _remove_doc(self, conn, path):
+        conn.execute('DELETE FROM postings WHERE doc_id IN (SELECT id FROM docs WHERE path = ?)', (path,))
+        conn.execute('DELETE FROM docs WHERE path = ?', (path,))
+
+    def index_files(self, paths):
+        """指定ファイルをインデックス（変更がないものはスキップ）し、更新数を返す"""
+        updated = 0
+        with self._connect() as conn:
+            known = dict(((row[0], (row[1], row[2])) for row in
+                          conn.execute('SELECT path, mtime, size FROM docs')))
+            for path in paths:
+                path = os.path.abspath(path)
+                if not path.lower().endswith(INDEX_EXTENSIONS):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    if path in known:
+                        self._remove_doc(conn, path)
+                        updated += 1
+                    continue
+                if known.get(path) == (st.st_mtime, st.st_size):
+                    continue
+                if self._index_doc(conn, path, st):
+                    updated += 1
+        return updated
+
+    def refresh(self, force=False):
+        """検索対象フォルダを走査し、追加・変更・削除されたファイルを反映して更新数を返す"""
+        if not force and time.time() - self.refreshed_at < self.refresh_interval:
+            return 0
+        if not self.refresh_lock.acquire(blocking=force):
+            return 0
+        try:
+            found = {}
+            for root in self.roots:
+                for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+                    dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                    for filename in filenames:
+                        if filename.lower().endswith(INDEX_EXTENSIONS):
+                            path = os.path.join(dirpath, filename)
+                            try:
+                                found[path] = os.stat(path)
+                            except OSError:
+                                pass
+
+            updated = 0
+            with self._connect() as conn:
+                known = dict(((row[0], (row[1], row[2])) for row in
+                              conn.execute('SELECT path, mtime, size FROM docs')))
+                for path in set(known) - set(found):
+                    self._remove_doc(conn, path)
+                    updated += 1
+                for path, st in found.items():
+                    if known.get(path) != (st.st_mtime, st.st_size):
+                        if self._index_doc(conn, path, st):
+                            updated += 1
+            self.refreshed_at = time.time()
+            return updated
+        finally:
+            self.refresh_lock.release()
+
+    def search(self, query, limit=20, k1=1.2, b=0.75):
+        """BM25でランキングした検索結果を返す（すべての語を含む文書のみ）
+
+        スコアの高い順に本文を確認し、limit件そろった時点で打ち切る。
+        """
+        terms = [normalize(term) for term in query.split() if term.strip()]
+        # 1文字の日本語は単独の出現しかインデックスにないため、本文の確認だけで絞り込む
+        tokens = sorted(set(t for t in tokenize(query) if len(t) > 1 or t.isascii()))
+        if not terms or limit <= 0:
+            return []
+        snippet_terms = [term for term in query.split() if term]
+
+        with self._connect() as conn:
+            total_docs, avg_length = conn.execute('SELECT COUNT(*), AVG(length) FROM docs').fetchone()
+            if not total_docs:
+                return []
+            avg_length = avg_length or 1
+
+            if not tokens:
+                # トークンで絞り込めない場合は、正規化済みの本文をSQLite内で検索して新しい順に返す
+                where = ' AND '.join('instr(normalized, ?) > 0' for _ in terms)
+                rows = conn.execute(
+                    f'SELECT path, title, mtime, content FROM docs WHERE {where} ORDER BY mtime DESC LIMIT ?',
+                    terms + [limit])
+                return [{
+                    'path': path,
+                    'title': title,
+                    'score': 0,
+                    'mtime': mtime,
+                    'snippet': make_snippet(content, snippet_terms)
+                } for path, title, mtime, content in rows]
+
+            # doc_id → [スコア, mtime]（すべてのトークンを含む文書のみ）
+            ranked = None
+            for token in tokens:
+                postings = conn.execute(
+                    'SELECT p.doc_id, p.tf, d.length, d.mtime FROM postings p JOIN docs d ON d.id = p.doc_id '
+                    'WHERE p.token = ?', (token,)).fetchall()
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                token_scores = {doc_id: (idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length)), mtime)
+                                for doc_id, tf, length, mtime in postings}
+                if ranked is None:
+                    ranked = token_scores
+                else:
+                    ranked = {doc_id: (score + token_scores[doc_id][0], mtime)
+                              for doc_id, (score, mtime) in ranked.items() if doc_id in token_scores}
+                if not ranked:
+                    return []
+
+            order = sorted(ranked, key=lambda doc_id: (-ranked[doc_id][0], -ranked[doc_id][1]))
+            results = []
+            batch_size = min(max(limit * 2, 10), VERIFY_BATCH)
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                placeholders = ','.join('?' * len(batch))
+                rows = {row[0]: row[1:] for row in conn.execute(
+                    f'SELECT id, path, title, normalized FROM docs WHERE id IN ({placeholders})', batch)}
+                for doc_id in batch:
+                    if doc_id not in rows:
+                        continue
+                    path, title, normalized = rows[doc_id]
+                    # bigramの組み合わせによる誤一致を除くため、各語が本文に含まれるか確認
+                    if not all(term in normalized for term in terms):
+                        continue
+                    content = conn.execute('SELECT content FROM docs WHERE id = ?', (doc_id,)).fetchone()[0]
+                    score, mtime = ranked[doc_id]
+                    results.append({
+                        'path': path,
+                        'title': title,
+                        'score': round(score, 4),
+                        'mtime': mtime,
+                        'snippet': make_snippet(content, snippet_terms)
+                    })
+                    if len(results) >= limit:
+                        return results
+        return results
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+AI1O Agent Web App 本番用起動スクリプト
+gunicorn（gthreadワーカー）で複数プロセス・複数スレッドで起動する
+
+使い方:
+  python serve.py --workers 4 --threads 8
+
+  kill -HUP <masterのPID>   設定を読み直してワーカーを順に入れ替える（グレースフルリスタート）
+  kill -TERM <masterのPID>  処理中のリクエストを待ってから終了
+"""
+import os
+import sys
+import argparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(script_dir)
+sys.path.insert(0, script_dir)
+
+from config import (HOST, PORT, UPLOAD_FOLDER, OUTPUT_FOLDER, SERVE_WORKERS, SERVE_THREADS, SERVE_KEEPALIVE, SERVE_TIMEOUT,
+                    SERVE_GRACEFUL_TIMEOUT, SERVE_MAX_REQUESTS)
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Windowsなどgunicornが使えない環境
+    BaseApplication = None
+
+
+def post_worker_init(worker):
+    """ワーカー起動後にバックグラウンド処理を開始"""
+    from app import start_upload_gc, mask_pool
+    from config import MASK_ON_UPLOAD
+    start_upload_gc()
+    # アップロード時マスキングが有効ならモデルを先にロードしておく
+    if MASK_ON_UPLOAD:
+        mask_pool.warm()
+
+
+# ワーカー終了時、実行中のジョブを打ち切ってから強制終了されるまでに残す秒数
+JOB_SHUTDOWN_MARGIN = 10
+
+
+def worker_exit(server, worker):
+    """ワーカー終了時に、そのワーカーで実行中のジョブとマスキングワーカーを終了
+
+    再起動（HUP・max_requests）や終了時も実行中のジョブはすぐには止めず、masterに強制終了される前まで
+    （graceful_timeout と timeout の短い方から JOB_SHUTDOWN_MARGIN 秒を引いた時間）完了を待つ。
+    それまでに終わらないジョブはキャンセルされる（ジョブはワーカーより長くは生きられない）。
+    """
+    from app import job_manager, mask_pool
+    limit = min(worker.cfg.graceful_timeout, worker.cfg.timeout or worker.cfg.graceful_timeout)
+    job_manager.shutdown(wait=max(0, limit - JOB_SHUTDOWN_MARGIN))
+    mask_pool.shutdown()
+
+
+if BaseApplication is not None:
+    class AgentWebApplication(BaseApplication):
+        """Flaskアプリをgunicornで起動するためのアプリケーション"""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            # ワーカープロセスごとに読み込む（ジョブ管理のスレッドをforkで共有しない）
+            from app import app
+            return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='AI1O Agent Web App を本番モードで起動')
+    parser.add_argument('--host', default=HOST, help='待ち受けホスト')
+    parser.add_argument('--port', type=int, default=PORT, help='待ち受けポート')
+    parser.add_argument('--workers', '-w', type=int, default=SERVE_WORKERS, help='ワーカープロセス数')
+    parser.add_argument('--threads', '-t', type=int, default=SERVE_THREADS, help='ワーカーごとのスレッド数')
+    parser.add_argument('--keepalive', type=int, default=SERVE_KEEPALIVE, help='Keep-Alive接続の待機秒数')
+    parser.add_argument('--timeout', type=int, default=SERVE_TIMEOUT, help='ワーカーのタイムアウト秒数')
+    parser.add_argument('--graceful-timeout', type=int, default=SERVE_GRACEFUL_TIMEOUT,
+                        help='再起動・終了時に処理中リクエストを待つ秒数')
+    parser.add_argument('--max-requests', type=int, default=SERVE_MAX_REQUESTS,
+                        help='この回数ごとにワーカーを入れ替える（0で無効）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("🚀 AI1O Agent Web App starting (production)...")
+    print(f"📍 URL: http://{args.host}:{args.port}")
+
+    if BaseApplication is None:
+        print("⚠️ gunicornが見つからないため、スレッド対応のWerkzeugサーバーで起動します（pip install gunicorn を推奨）")
+        from app import app, prepare_app, start_upload_gc
+        prepare_app()
+        start_upload_gc()
+        app.run(debug=False, host=args.host, port=args.port, threaded=True)
+        return
+
+    # masterプロセスではappを読み込まない（ワーカーはforkではなく各自で読み込む）
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    print(f"👷 Workers: {args.workers} x {args.threads} threads")
+
+    options = {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'keepalive': args.keepalive,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'accesslog': '-',
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+    }
+    AgentWebApplication(options).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+内容アドレス方式のアップロードストア
+ファイル本体は SHA-256 をキーに UPLOAD_FOLDER/.blobs に1つだけ保存し、
+UPLOAD_FOLDER 直下のファイル名はそのハードリンク（不可ならシンボリックリンク）にする
+"""
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+BLOB_DIR = '.blobs'
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+class HashingWriter:
+    """書き込みながらSHA-256を計算するファイルラッパー"""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.fp.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def hash_file(path):
+    """ファイルのSHA-256を一定サイズずつ読み込んで計算"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for buf in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            sha256.update(buf)
+    return sha256.hexdigest()
+
+
+def blob_path(upload_folder, digest):
+    """ハッシュ値に対応するblobのパス"""
+    digest = digest.lower()
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        raise ValueError(f'不正なハッシュ値です: {digest}')
+    return os.path.join(upload_folder, BLOB_DIR, digest[:2], digest)
+
+
+def temp_file(upload_folder):
+    """blobと同じファイルシステム上に一時ファイルを作成し (fp, path) を返す"""
+    tmp_dir = os.path.join(upload_folder, BLOB_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=tmp_dir)
+    return os.fdopen(fd, 'wb'), path
+
+
+def _points_to(path, blob, digest):
+    """nameエントリが指定blobと同じ内容か（リンクでなくコピーの場合は内容を比較）"""
+    try:
+        if os.path.samefile(path, blob):
+            return True
+        return (not os.path.islink(path) and os.path.getsize(path) == os.path.getsize(blob)
+                and hash_file(path) == digest)
+    except OSError:
+        return False
+
+
+def _make_link(blob, path):
+    """blobへのリンクをファイル名の位置に直接作成（ハードリンク → シンボリックリンク → コピー）
+
+    既存のエントリは上書きせず、FileExistsError を送出する。
+    """
+    try:
+        os.link(blob, path)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.relpath(blob, os.path.dirname(path)), path)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    with open(path, 'xb') as dst, open(blob, 'rb') as src:
+        shutil.copyfileobj(src, dst, HASH_BUFFER_SIZE)
+
+
+def link_name(upload_folder, digest, filename):
+    """blobにファイル名のエントリを作成し、実際に使われたファイル名を返す
+
+    同名で別内容のファイルがある場合は上書きせず、ハッシュ付きの名前にする。
+    存在確認と作成の間に他のアップロードが割り込んでも上書きしないよう、
+    エントリは最終的な名前に排他的に作成する。
+    """
+    blob = blob_path(upload_folder, digest)
+    stem, ext = os.path.splitext(filename)
+    candidates = [filename, f'{stem}_{digest[:8]}{ext}']
+    candidates += [f'{stem}_{digest[:8]}_{n}{ext}' for n in range(1, 100)]
+    for name in candidates:
+        path = os.path.join(upload_folder, name)
+        try:
+            _make_link(blob, path)
+            return name
+        except FileExistsError:
+            if _points_to(path, blob, digest):
+                return name
+    raise FileExistsError(f'ファイル名を決められません: {filename}')
+
+
+def link_existing(upload_folder, digest, filename, size):
+    """既に保存済みのblobがあればリンクしてファイル名を返す（なければNone）
+
+    ハッシュ値とサイズの両方が一致するblobだけを使う（一致しなければ通常どおりアップロードさせる）。
+    """
+    try:
+        blob = blob_path(upload_folder, digest)
+        if os.path.getsize(blob) != size:
+            return None
+    except (ValueError, OSError):
+        return None
+    # GCと競合しないよう、参照前にmtimeを更新
+    os.utime(blob)
+    return link_name(upload_folder, digest, filename)
+
+
+def store_file(upload_folder, tmp_path, filename, digest=None):
+    """一時ファイルをblobとして保存し、ファイル名のエントリを作成
+
+    同じ内容のblobがあれば一時ファイルは破棄する。実際のファイル名を返す。
+    """
+    if digest is None:
+        digest = hash_file(tmp_path)
+    blob = blob_path(upload_folder, digest)
+    if os.path.exists(blob):
+        os.remove(tmp_path)
+        os.utime(blob)
+    else:
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        # リンク経由で内容が書き換えられないよう読み取り専用にする
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, blob)
+    return link_name(upload_folder, digest, filename)
+
+
+def gc_blobs(upload_folder, grace_period=3600):
+    """どのファイル名からも参照されていないblobを削除し、削除数を返す
+
+    作成・参照から grace_period 秒以内のblobは、リンク作成中の可能性があるため残す。
+    """
+    blob_root = os.path.join(upload_folder, BLOB_DIR)
+    if not os.path.isdir(blob_root):
+        return 0
+
+    # シンボリックリンク経由の参照を収集
+    referenced = set()
+    for entry in os.scandir(upload_folder):
+        if entry.is_symlink():
+            referenced.add(os.path.realpath(entry.path))
+
+    removed = 0
+    now = time.time()
+    for prefix in os.scandir(blob_root):
+        if not prefix.is_dir() or prefix.name == 'tmp':
+            continue
+        for entry in os.scandir(prefix.path):
+            st = entry.stat(follow_symlinks=False)
+            if st.st_nlink > 1 or os.path.realpath(entry.path) in referenced:
+                continue
+            if now - st.st_mtime < grace_period:
+                continue
+            os.remove(entry.path)
+            removed += 1
+
+    # 取り残された一時ファイルも削除
+    tmp_dir = os.path.join(blob_root, 'tmp')
+    if os.path.isdir(tmp_dir):
+        for entry in os.scandir(tmp_dir):
+            if now - entry.stat().st_mtime >= grace_period:
+                os.remove(entry.path)
+
+    return removed
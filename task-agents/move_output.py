@@ -1,43 +1,341 @@
 #!/usr/bin/env python3
 """
 app/output フォルダの内容を ../output に移動するスクリプト
+
+既存の output を消さずに差分だけをマージする:
+  - サイズと更新日時（--checksum 指定時はSHA-256）が同じファイルはスキップ
+    （同じデバイスではナノ秒単位で比較、別デバイスでは秒単位で一致した後にSHA-256で確認）
+  - 同じファイルシステム上では os.replace による原子的なリネームで移動
+    （移動先に無いフォルダはフォルダごと1回のリネームで移動）
+  - 別デバイスへの移動のみ、一時ファイルへのストリームコピーを並列に行ってから置き換える
+
+使い方:
+  python move_output.py --dry-run     何も変更せずに実行内容（操作ごとの一覧と集計）を表示
+  python move_output.py --workers 8   別デバイスへのコピーの並列数を指定
 """
 import os
+import sys
+import time
+import errno
 import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+SKIP = 'skip'
+RENAME = 'rename'
+RENAME_DIR = 'rename_dir'
+COPY = 'copy'
+REPLACE_DIR = 'replace_dir'
+
+
+def file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def tree_size(path):
+    """フォルダ内のファイル数と合計サイズ"""
+    count = size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            count += 1
+            size += os.lstat(os.path.join(dirpath, filename)).st_size
+    return count, size
+
+
+def nearest_device(path):
+    """パス（存在しなければ最も近い親フォルダ）のデバイス番号"""
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+def unchanged(src_stat, dst_stat, src_path, dst_path, checksum, same_device=True):
+    """移動先が移動元と同じ内容か（スキップした移動元は削除されるため、疑わしい場合は False）"""
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if checksum:
+        return file_hash(src_path) == file_hash(dst_path)
+    if same_device:
+        return src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+    # 別デバイスはファイルシステムごとの精度差があるため秒単位で比較し、一致した場合は内容も確認する
+    if int(src_stat.st_mtime) != int(dst_stat.st_mtime):
+        return False
+    return file_hash(src_path) == file_hash(dst_path)
+
+
+def plan_sync(source_dir, target_dir, checksum=False):
+    """移動内容を (操作, 移動元, 移動先, ファイル数, バイト数) のリストにする"""
+    actions = []
+    target_device = nearest_device(target_dir)
+
+    def walk(src, dst):
+        for entry in sorted(os.scandir(src), key=lambda e: e.name):
+            dst_path = os.path.join(dst, entry.name)
+            same_device = entry.stat(follow_symlinks=False).st_dev == target_device
+            is_dir = entry.is_dir(follow_symlinks=False)
+
+            if is_dir:
+                if os.path.isdir(dst_path) and not os.path.islink(dst_path):
+                    walk(entry.path, dst_path)
+                    continue
+                count, size = tree_size(entry.path)
+                if os.path.lexists(dst_path):
+                    # 移動先の同名ファイルはフォルダで置き換える
+                    actions.append((REPLACE_DIR, entry.path, dst_path, 0, 0))
+                if same_device:
+                    actions.append((RENAME_DIR, entry.path, dst_path, count, size))
+                else:
+                    for dirpath, _, filenames in os.walk(entry.path):
+                        rel = os.path.relpath(dirpath, entry.path)
+                        for filename in filenames:
+                            path = os.path.join(dirpath, filename)
+                            actions.append((COPY, path, os.path.normpath(os.path.join(dst_path, rel, filename)),
+                                            1, os.lstat(path).st_size))
+                continue
+
+            src_stat = entry.stat(follow_symlinks=False)
+            if os.path.isdir(dst_path) and not os.path.islink(dst_path):
+                actions.append((REPLACE_DIR, entry.path, dst_path, 0, 0))
+            elif os.path.lexists(dst_path) and not entry.is_symlink():
+                if unchanged(src_stat, os.lstat(dst_path), entry.path, dst_path, checksum, same_device):
+                    actions.append((SKIP, entry.path, dst_path, 1, src_stat.st_size))
+                    continue
+            actions.append((RENAME if same_device else COPY, entry.path, dst_path, 1, src_stat.st_size))
+
+    walk(source_dir, target_dir)
+    return actions
+
+
+class Progress:
+    """処理済みファイル数・バイト数を一定間隔で表示"""
+
+    def __init__(self, total_files, total_bytes, interval=1.0, enabled=True):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.enabled = enabled
+        self.files = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.printed = 0
+        self.lock = threading.Lock()
+
+    def update(self, files, size):
+        with self.lock:
+            self.files += files
+            self.bytes += size
+            now = time.monotonic()
+            if self.enabled and now - self.printed >= self.interval:
+                self.printed = now
+                self._print(now)
+
+    def finish(self):
+        if self.enabled:
+            self._print(time.monotonic())
+
+    def _print(self, now):
+        elapsed = now - self.started
+        rate = self.bytes / elapsed / 1024 / 1024 if elapsed > 0 else 0
+        percent = self.bytes * 100 // self.total_bytes if self.total_bytes else 100
+        print(f"  [{self.files}/{self.total_files} files] {format_size(self.bytes)} / "
+              f"{format_size(self.total_bytes)} ({percent}%) {rate:.1f} MB/s", flush=True)
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
 
-def move_output():
-    source_dir = "app/output"
-    target_dir = "output"
-    
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def copy_file(src, dst):
+    """一時ファイルへコピーしてから置き換え、移動元を削除（別デバイス間の移動）"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.islink(src):
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(dst) + '.', dir=os.path.dirname(dst))
+        os.close(fd)
+        os.remove(tmp_path)
+        os.symlink(os.readlink(src), tmp_path)
+    else:
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(dst) + '.', dir=os.path.dirname(dst))
+        try:
+            with open(src, 'rb') as fsrc, os.fdopen(fd, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+            shutil.copystat(src, tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, dst)
+    os.remove(src)
+
+
+def rename(src, dst):
+    """原子的にリネーム（実際には別デバイスだった場合はコピーにフォールバック）"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if os.path.isdir(src) and not os.path.islink(src):
+            shutil.copytree(src, dst, symlinks=True)
+            shutil.rmtree(src)
+        else:
+            copy_file(src, dst)
+
+
+def remove_empty_dirs(path):
+    """空になったフォルダを下から順に削除"""
+    for dirpath, _, _ in sorted(os.walk(path), key=lambda item: len(item[0]), reverse=True):
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+
+
+def summarize(actions):
+    summary = {}
+    for action, _, _, files, size in actions:
+        count, total = summary.get(action, (0, 0))
+        summary[action] = (count + files, total + size)
+    return summary
+
+
+def print_summary(actions, dry_run):
+    summary = summarize(actions)
+    labels = {
+        RENAME: 'リネーム（ファイル）',
+        RENAME_DIR: 'リネーム（フォルダごと）',
+        COPY: 'コピー（別デバイス）',
+        SKIP: 'スキップ（変更なし）',
+    }
+    print("📋 Dry run summary:" if dry_run else "📋 Summary:")
+    for action, label in labels.items():
+        files, size = summary.get(action, (0, 0))
+        print(f"  {label}: {files} files, {format_size(size)}")
+    replaced = sum(1 for action in actions if action[0] == REPLACE_DIR)
+    if replaced:
+        print(f"  ファイルとフォルダの種類が異なるため置き換え: {replaced} entries")
+
+
+def print_plan(actions):
+    """実行予定の操作を1件ずつ表示（スキップするファイルは集計のみ）"""
+    labels = {
+        RENAME: 'rename',
+        RENAME_DIR: 'rename dir',
+        COPY: 'copy',
+        REPLACE_DIR: 'remove',
+    }
+    print("📝 Planned entries:")
+    for action, src, dst, files, size in actions:
+        if action == SKIP:
+            continue
+        if action == REPLACE_DIR:
+            print(f"  {labels[action]:<10} {dst}")
+        else:
+            print(f"  {labels[action]:<10} {src} -> {dst} ({files} files, {format_size(size)})")
+
+
+def move_output(source_dir="app/output", target_dir="output", dry_run=False, checksum=False,
+                workers=4, progress=True):
     print(f"Moving contents from {source_dir} to {target_dir}")
-    
+
+    if not os.path.exists(source_dir):
+        print(f"ℹ️ {source_dir} does not exist, nothing to move")
+        return {}
+
     # ターゲットディレクトリが存在しない場合は作成
     if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
-        print(f"Created {target_dir}")
-    
-    # ソースディレクトリが存在する場合のみ処理
-    if os.path.exists(source_dir):
-        # フォルダ内のすべてのファイル・フォルダを移動
-        for item in os.listdir(source_dir):
-            source_path = os.path.join(source_dir, item)
-            target_path = os.path.join(target_dir, item)
-            
-            print(f"Moving: {source_path} -> {target_path}")
-            
-            if os.path.exists(target_path):
-                if os.path.isdir(target_path):
-                    shutil.rmtree(target_path)
-                else:
-                    os.remove(target_path)
-            
-            shutil.move(source_path, target_path)
-        
-        # 空になったソースディレクトリを削除
-        os.rmdir(source_dir)
+        if dry_run:
+            print(f"Would create {target_dir}")
+        else:
+            os.makedirs(target_dir)
+            print(f"Created {target_dir}")
+
+    actions = plan_sync(source_dir, target_dir, checksum=checksum)
+    summary = summarize(actions)
+    if dry_run:
+        print_plan(actions)
+    print_summary(actions, dry_run)
+    if dry_run:
+        return summary
+
+    total_files = sum(files for _, _, _, files, _ in actions)
+    total_bytes = sum(size for _, _, _, _, size in actions)
+    report = Progress(total_files, total_bytes, enabled=progress)
+
+    # 同じファイルシステム内の移動はリネームだけなので順番に、別デバイスへのコピーは並列に行う
+    copies = []
+    for action, src, dst, files, size in actions:
+        if action == SKIP:
+            os.remove(src)
+        elif action == REPLACE_DIR:
+            remove_path(dst)
+            continue
+        elif action in (RENAME, RENAME_DIR):
+            rename(src, dst)
+        else:
+            copies.append((src, dst, size))
+            continue
+        report.update(files, size)
+
+    if copies:
+        def copy_one(item):
+            src, dst, size = item
+            copy_file(src, dst)
+            report.update(1, size)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(copy_one, item) for item in copies]:
+                future.result()
+
+    report.finish()
+
+    # 空になったソースディレクトリを削除
+    remove_empty_dirs(source_dir)
+    if not os.path.exists(source_dir):
         print(f"Removed empty {source_dir}")
-        
+
     print("✅ Output folder migration completed!")
+    return summary
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='app/output の内容を output にマージして移動')
+    parser.add_argument('--source', default='app/output', help='移動元フォルダ')
+    parser.add_argument('--target', default='output', help='移動先フォルダ')
+    parser.add_argument('--dry-run', action='store_true', help='変更せずに実行内容の一覧と集計を表示')
+    parser.add_argument('--checksum', action='store_true',
+                        help='更新日時ではなくSHA-256で変更の有無を判定')
+    parser.add_argument('--workers', type=int, default=4, help='別デバイスへのコピーの並列数')
+    parser.add_argument('--quiet', action='store_true', help='進捗を表示しない')
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    move_output()
\ No newline at end of file
+    args = parse_args()
+    try:
+        move_output(args.source, args.target, dry_run=args.dry_run, checksum=args.checksum,
+                    workers=args.workers, progress=not args.quiet)
+    except OSError as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)